@@ -15,8 +15,11 @@ class ProjectConfig:
     DOMINIO_BASE: str = "https://libertaciviliimmigrazione.dlci.interno.gov.it"
     DOWNLOAD_TIMEOUT: int = 30
     MAX_RETRIES: int = 3
+    DOWNLOAD_WORKERS: int = 8
+    CHECK_UPDATES: bool = True
     
     # Extraction settings
+    EXTRACTION_WORKERS: int = os.cpu_count() or 1
     DEFAULT_START_YEAR: int = 2017
     DEFAULT_START_MONTH: int = 1
     
@@ -8,8 +8,11 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 import sys
+import io
+import hashlib
+import functools
 from pathlib import Path
 import os
 
@@ -37,7 +40,9 @@ if str(project_root) not in sys.path:
 
 # Import dei moduli personalizzati
 try:
-    from utils.parquet_database import database, get_table_names, quick_query
+    from utils.parquet_database import get_database, get_table_names, quick_query
+    from utils.file_utils import DataProcessor
+    database = get_database()
     IMPORT_SUCCESS = True
     print("Import di parquet_database riuscito")
     
@@ -58,8 +63,14 @@ except ImportError as e:
 # Cache per le query al database
 @st.cache_data(ttl=3600)
 def load_table_data(table_name):
-    """Carica i dati dalla tabella specificata"""
-    return database.get_table(table_name)
+    """Carica i dati dalla tabella specificata (colonne categoriche già impostate dal database)"""
+    # Copia: al primo accesso st.cache_data restituisce l'oggetto stesso e alcuni chiamanti aggiungono colonne
+    return database.get_table(table_name).copy()
+
+@st.cache_data(ttl=3600)
+def get_distinct(table_name, column):
+    """Restituisce i valori distinti di una colonna senza caricare l'intera tabella"""
+    return database.get_distinct_values(table_name, column)
 
 # Prende il nome dell'ultimo file scaricato
 def get_ultimo_aggiornamento():
@@ -88,8 +99,14 @@ def query_filtered_data(table_name, start_date=None, end_date=None, filters=None
 if 'data_loaded' not in st.session_state:
     st.session_state.data_loaded = False
 
+def _hash_dataframe(df):
+    """Chiave di cache leggera per i DataFrame passati alle funzioni memorizzate"""
+    # Hash delle righe nell'ordine in cui compaiono: stesse righe in ordine diverso danno chiavi diverse
+    row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return (df.shape, tuple(df.columns), hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest())
+
 # NUOVE FUNZIONI PER CALCOLO FLUSSI
-@st.cache_data(ttl=3600)
+@st.cache_data(ttl=3600, show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
 def calculate_monthly_flow(df, group_columns, value_column):
     """
     Calcola il flusso mensile dai dati cumulativi annuali
@@ -98,29 +115,72 @@ def calculate_monthly_flow(df, group_columns, value_column):
     if df.empty:
         return pd.DataFrame()
     
+    group_columns = list(group_columns)
     df = df.copy()
-    df['anno'] = pd.to_datetime(df['data_riferimento']).dt.year
-    df['mese'] = pd.to_datetime(df['data_riferimento']).dt.month
+    date_rif = pd.to_datetime(df['data_riferimento'])
+    df['anno'] = date_rif.dt.year
+    df['mese'] = date_rif.dt.month
     
     # Ordina per gruppo, anno e mese
     df = df.sort_values(group_columns + ['anno', 'mese'])
     
-    # Forward fill per gestire mesi mancanti
-    df['valore_ffill'] = df.groupby(group_columns)[value_column].ffill()
+    # Un solo raggruppamento: ffill per gruppo e codici di gruppo per il diff
+    grouped = df.groupby(group_columns, sort=False, observed=True)
+    group_id = grouped.ngroup()
     
-    # Calcola flusso mensile (differenza rispetto al mese precedente)
-    df['flusso_mensile'] = df.groupby(group_columns)['valore_ffill'].diff()
+    # Forward fill per gestire mesi mancanti
+    df['valore_ffill'] = grouped[value_column].ffill()
     
-    # Per il primo mese di ogni anno/gruppo, il flusso = valore cumulativo
-    df['flusso_mensile'] = df.groupby(group_columns)['flusso_mensile'].transform(
-        lambda x: x.fillna(x.iloc[0]) if not x.empty else x
-    )
+    # Calcola flusso mensile (differenza rispetto al mese precedente, righe già ordinate per gruppo);
+    # il primo mese di ogni gruppo resta senza flusso
+    df['flusso_mensile'] = df['valore_ffill'].diff().where(group_id.eq(group_id.shift()))
     
     # Rimuovi righe senza dati
     df = df.dropna(subset=['valore_ffill'])
     
     return df
 
+@st.cache_data(ttl=3600, show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
+def _flow_for_range(df, group_columns, value_column, start_date, end_date):
+    """Calcola i flussi mensili solo sulle righe del periodo selezionato e aggiunge la data del mese"""
+    if df.empty:
+        return pd.DataFrame()
+    
+    date_rif = pd.to_datetime(df['data_riferimento'])
+    flow_data = calculate_monthly_flow(
+        df[(date_rif >= start_date) & (date_rif <= end_date)],
+        group_columns=tuple(group_columns),
+        value_column=value_column
+    )
+    
+    if not flow_data.empty:
+        flow_data['data_completa'] = pd.to_datetime(
+            dict(year=flow_data['anno'], month=flow_data['mese'], day=1)
+        )
+    
+    return flow_data
+
+@st.cache_data(ttl=3600, hash_funcs={pd.DataFrame: _hash_dataframe})
+def build_monthly_flow_pivot(flow_data, index_column, value_column='flusso_mensile'):
+    """Costruisce la tabella riepilogativa dei flussi mensili (righe: index_column, colonne: anno-mese)"""
+    pivot_table = (
+        flow_data.groupby([index_column, 'anno', 'mese'], observed=True)[value_column]
+        .sum()
+        .unstack(['anno', 'mese'], fill_value=0)
+        .sort_index(axis=1)
+    )
+    
+    # Riformatta i nomi delle colonne
+    pivot_table.columns = [f"{anno}-{mese:02d}" for anno, mese in pivot_table.columns]
+    return pivot_table.round(0)
+
+@st.cache_data(ttl=3600, hash_funcs={pd.DataFrame: _hash_dataframe})
+def _df_to_csv(df, index=False):
+    """Serializza un DataFrame in CSV (bytes) per i pulsanti di download"""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=index)
+    return buffer.getvalue()
+
 @st.cache_data(ttl=3600)
 def get_available_years_months_for_cumulative():
     """Restituisce gli anni e mesi disponibili per dati cumulativi (nazionalità e accoglienza)"""
@@ -151,6 +211,14 @@ def get_available_years_months_for_cumulative():
     
     return sorted_years_months
 
+@st.cache_data(ttl=3600)
+def get_top_nazionalita(year, k=5):
+    """Restituisce le k nazionalità con più migranti sbarcati nell'anno indicato"""
+    df = load_table_data('dati_nazionalita')
+    data_year = df[pd.to_datetime(df['data_riferimento']).dt.year == year]
+    totali_nazionalita = data_year.groupby('nazionalita', as_index=False, observed=True)['migranti_sbarcati'].sum()
+    return DataProcessor.top_k_by(totali_nazionalita, 'nazionalita', 'migranti_sbarcati', k)
+
 # FUNZIONI PER LE NUOVE VISUALIZZAZIONI FLUSSI
 def create_nationality_trend_chart(df, selected_nationalities, start_date, end_date):
     """Crea un line chart per l'andamento temporale delle nazionalità selezionate (flussi)"""
@@ -158,24 +226,13 @@ def create_nationality_trend_chart(df, selected_nationalities, start_date, end_d
         return None
     
     # Calcola flussi mensili
-    flow_data = calculate_monthly_flow(
+    flow_data = _flow_for_range(
         df[df['nazionalita'].isin(selected_nationalities)],
-        group_columns=['nazionalita'],
-        value_column='migranti_sbarcati'
-    )
-    
-    if flow_data.empty:
-        return None
-    
-    # Filtra per periodo
-    flow_data['data_completa'] = pd.to_datetime(
-        flow_data['anno'].astype(str) + '-' + 
-        flow_data['mese'].astype(str) + '-01'
+        group_columns=('nazionalita',),
+        value_column='migranti_sbarcati',
+        start_date=start_date,
+        end_date=end_date
     )
-    flow_data = flow_data[
-        (flow_data['data_completa'] >= pd.Timestamp(start_date)) & 
-        (flow_data['data_completa'] <= pd.Timestamp(end_date))
-    ]
     
     if flow_data.empty:
         return None
@@ -222,27 +279,19 @@ def create_nationality_bar_chart(df, start_date, end_date, selected_nationalitie
         return None
     
     # Calcola flussi mensili
-    flow_data = calculate_monthly_flow(
+    flow_data = _flow_for_range(
         df[df['nazionalita'].isin(selected_nationalities)],
-        group_columns=['nazionalita'],
-        value_column='migranti_sbarcati'
+        group_columns=('nazionalita',),
+        value_column='migranti_sbarcati',
+        start_date=start_date,
+        end_date=end_date
     )
     
     if flow_data.empty:
         return None
     
-    # Filtra per periodo
-    flow_data['data_completa'] = pd.to_datetime(
-        flow_data['anno'].astype(str) + '-' + 
-        flow_data['mese'].astype(str) + '-01'
-    )
-    flow_data = flow_data[
-        (flow_data['data_completa'] >= pd.Timestamp(start_date)) & 
-        (flow_data['data_completa'] <= pd.Timestamp(end_date))
-    ]
-    
     # Calcola totale flusso per nazionalità nel periodo
-    nationality_totals = flow_data.groupby('nazionalita')['flusso_mensile'].sum().reset_index()
+    nationality_totals = flow_data.groupby('nazionalita', observed=True)['flusso_mensile'].sum().reset_index()
     nationality_totals = nationality_totals.sort_values('flusso_mensile', ascending=False)
     
     # Togli valori negativi (imposta a 0 per visualizzazione)
@@ -292,10 +341,12 @@ def create_accommodation_pie_chart(df, selected_types, start_date, end_date):
     flow_data_list = []
     for col in selected_cols:
         if col in df.columns:
-            col_flow = calculate_monthly_flow(
+            col_flow = _flow_for_range(
                 df[['data_riferimento', 'regione', col]],
-                group_columns=['regione'],
-                value_column=col
+                group_columns=('regione',),
+                value_column=col,
+                start_date=start_date,
+                end_date=end_date
             )
             if not col_flow.empty:
                 # Trova il nome della tipologia
@@ -309,18 +360,8 @@ def create_accommodation_pie_chart(df, selected_types, start_date, end_date):
     
     flow_data = pd.concat(flow_data_list, ignore_index=True)
     
-    # Filtra per periodo
-    flow_data['data_completa'] = pd.to_datetime(
-        flow_data['anno'].astype(str) + '-' + 
-        flow_data['mese'].astype(str) + '-01'
-    )
-    flow_data = flow_data[
-        (flow_data['data_completa'] >= pd.Timestamp(start_date)) & 
-        (flow_data['data_completa'] <= pd.Timestamp(end_date))
-    ]
-    
     # Somma flussi per tipologia
-    pie_data = flow_data.groupby('tipologia')['flusso'].sum().reset_index()
+    pie_data = flow_data.groupby('tipologia', observed=True)['flusso'].sum().reset_index()
     pie_data['flusso'] = pie_data['flusso'].clip(lower=0)  # Togli valori negativi
     
     # Prepara titolo
@@ -373,27 +414,19 @@ def create_regional_flow_map(df, selected_types, start_date, end_date):
         return None
     
     # Calcola flussi per regione (sommando tutte le tipologie)
-    flow_data = calculate_monthly_flow(
+    flow_data = _flow_for_range(
         df,
-        group_columns=['regione'],
-        value_column='totale_accoglienza'
+        group_columns=('regione',),
+        value_column='totale_accoglienza',
+        start_date=start_date,
+        end_date=end_date
     )
     
     if flow_data.empty:
         return None
     
-    # Filtra per periodo
-    flow_data['data_completa'] = pd.to_datetime(
-        flow_data['anno'].astype(str) + '-' + 
-        flow_data['mese'].astype(str) + '-01'
-    )
-    flow_data = flow_data[
-        (flow_data['data_completa'] >= pd.Timestamp(start_date)) & 
-        (flow_data['data_completa'] <= pd.Timestamp(end_date))
-    ]
-    
     # Calcola flusso totale cumulato per regione
-    regional_totals = flow_data.groupby('regione')['flusso_mensile'].sum().reset_index()
+    regional_totals = flow_data.groupby('regione', observed=True)['flusso_mensile'].sum().reset_index()
     regional_totals['flusso_mensile'] = regional_totals['flusso_mensile'].clip(lower=0)
     
     # Coordinate delle regioni italiane
@@ -488,31 +521,25 @@ def create_nationality_stock_trend_chart(df, selected_nationalities, start_date,
     if df.empty or len(selected_nationalities) == 0:
         return None
     
-    # Filtra per nazionalità selezionate
-    df = df[df['nazionalita'].isin(selected_nationalities)].copy()
-    
-    # Estrai data e ordina
-    df['data_completa'] = pd.to_datetime(df['data_riferimento'])
-    df = df.sort_values('data_completa')
-    
-    # Filtra per periodo
+    # Filtra per nazionalità selezionate e per periodo (data_riferimento è già datetime64)
     df = df[
-        (df['data_completa'] >= pd.Timestamp(start_date)) & 
-        (df['data_completa'] <= pd.Timestamp(end_date))
-    ]
+        df['nazionalita'].isin(selected_nationalities) &
+        (df['data_riferimento'] >= start_date) & 
+        (df['data_riferimento'] <= end_date)
+    ].sort_values('data_riferimento')
     
     if df.empty:
         return None
     
     fig = px.line(
         df,
-        x='data_completa',
+        x='data_riferimento',
         y='migranti_sbarcati',
         color='nazionalita',
         title="Andamento stock cumulativo per nazionalità",
         labels={
             'migranti_sbarcati': 'Migranti sbarcati (stock cumulativo)', 
-            'data_completa': 'Mese',
+            'data_riferimento': 'Mese',
             'nazionalita': 'Nazionalità'
         },
         markers=True
@@ -545,28 +572,22 @@ def create_nationality_stock_bar_chart(df, start_date, end_date, selected_nation
     if df.empty:
         return None
     
-    # Filtra per nazionalità selezionate
-    df = df[df['nazionalita'].isin(selected_nationalities)].copy()
-    
-    # Estrai data e ordina
-    df['data_completa'] = pd.to_datetime(df['data_riferimento'])
-    df = df.sort_values('data_completa')
-    
-    # Filtra per periodo
+    # Filtra per nazionalità selezionate e per periodo
     df = df[
-        (df['data_completa'] >= pd.Timestamp(start_date)) & 
-        (df['data_completa'] <= pd.Timestamp(end_date))
+        df['nazionalita'].isin(selected_nationalities) &
+        (df['data_riferimento'] >= start_date) & 
+        (df['data_riferimento'] <= end_date)
     ]
     
     if df.empty:
         return None
     
     # Prendi l'ultimo mese disponibile nel periodo
-    last_date = df['data_completa'].max()
-    last_month_data = df[df['data_completa'] == last_date]
+    last_date = df['data_riferimento'].max()
+    last_month_data = df[df['data_riferimento'] == last_date]
     
     # Calcola stock cumulativo per nazionalità nell'ultimo mese
-    nationality_totals = last_month_data.groupby('nazionalita')['migranti_sbarcati'].sum().reset_index()
+    nationality_totals = last_month_data.groupby('nazionalita', observed=True)['migranti_sbarcati'].sum().reset_index()
     nationality_totals = nationality_totals.sort_values('migranti_sbarcati', ascending=False)
     
     # Prepara titolo
@@ -598,23 +619,18 @@ def create_regional_stock_map(df, selected_types, start_date, end_date):
     if df.empty:
         return None
     
-    # Estrai data e ordina
-    df = df.copy()
-    df['data_completa'] = pd.to_datetime(df['data_riferimento'])
-    df = df.sort_values('data_completa')
-    
     # Filtra per periodo
     df = df[
-        (df['data_completa'] >= pd.Timestamp(start_date)) & 
-        (df['data_completa'] <= pd.Timestamp(end_date))
+        (df['data_riferimento'] >= start_date) & 
+        (df['data_riferimento'] <= end_date)
     ]
     
     if df.empty:
         return None
     
     # Prendi l'ultimo mese disponibile nel periodo
-    last_date = df['data_completa'].max()
-    last_month_data = df[df['data_completa'] == last_date]
+    last_date = df['data_riferimento'].max()
+    last_month_data = df[df['data_riferimento'] == last_date].copy()
     
     # Somma le colonne selezionate per ottenere totale regionale
     type_columns = {
@@ -721,23 +737,18 @@ def create_accommodation_stock_pie_chart(df, selected_types, start_date, end_dat
     if df.empty:
         return None
     
-    # Estrai data e ordina
-    df = df.copy()
-    df['data_completa'] = pd.to_datetime(df['data_riferimento'])
-    df = df.sort_values('data_completa')
-    
     # Filtra per periodo
     df = df[
-        (df['data_completa'] >= pd.Timestamp(start_date)) & 
-        (df['data_completa'] <= pd.Timestamp(end_date))
+        (df['data_riferimento'] >= start_date) & 
+        (df['data_riferimento'] <= end_date)
     ]
     
     if df.empty:
         return None
     
     # Prendi l'ultimo mese disponibile nel periodo
-    last_date = df['data_completa'].max()
-    last_month_data = df[df['data_completa'] == last_date]
+    last_date = df['data_riferimento'].max()
+    last_month_data = df[df['data_riferimento'] == last_date]
     
     # Mappa colonne
     type_columns = {
@@ -821,7 +832,7 @@ def create_daily_column_chart(df, start_date, end_date):
                             on='data_completa', how='left')
         df_merged['migranti_sbarcati'] = df_merged['migranti_sbarcati'].fillna(0)
         
-        df_merged = df_merged.sort_values('data_completa')
+        df_merged = df_merged.sort_values('data_completa', ignore_index=True)
         
         fig = px.bar(
             df_merged,
@@ -920,6 +931,208 @@ def create_daily_heatmap(df):
     )
     
     return fig
+# FUNZIONI PER LE METRICHE PRINCIPALI
+@st.cache_data(ttl=3600, hash_funcs={pd.DataFrame: _hash_dataframe})
+def compute_flow_metrics(filtered_data, group_columns, value_column, start_date, end_date):
+    """Calcola le metriche di flusso mensile per i dati cumulativi"""
+    flow_data = _flow_for_range(
+        filtered_data,
+        group_columns=tuple(group_columns),
+        value_column=value_column,
+        start_date=start_date,
+        end_date=end_date
+    )
+    
+    if flow_data.empty:
+        return None
+    
+    total_flow = flow_data['flusso_mensile'].sum()
+    num_months = flow_data[['anno', 'mese']].drop_duplicates().shape[0]
+    
+    return {
+        'total_flow': total_flow,
+        'num_months': num_months,
+        'avg_monthly_flow': total_flow / num_months if num_months else 0,
+        'n_negative': int((flow_data['flusso_mensile'].values < 0).sum())
+    }
+
+@st.cache_data(ttl=3600, hash_funcs={pd.DataFrame: _hash_dataframe})
+def compute_stock_metrics(filtered_data, value_column):
+    """Calcola le metriche di stock (dati cumulativi originali)"""
+    # Una riga per mese, ordinata per data
+    stock_mensile = filtered_data.groupby('data_riferimento', sort=True)[value_column].sum()
+    first_stock, total_stock = stock_mensile.iloc[0], stock_mensile.iloc[-1]
+    
+    # Variazione percentuale rispetto al primo mese del periodo
+    if first_stock > 0:
+        pct_change = ((total_stock - first_stock) / first_stock) * 100
+    else:
+        pct_change = 0
+    
+    return {
+        'first_date': stock_mensile.index[0],
+        'last_date': stock_mensile.index[-1],
+        'total_stock': total_stock,
+        'pct_change': pct_change,
+        'avg_stock': stock_mensile.mean()
+    }
+
+def render_cumulative_metrics(filtered_data, start_date, end_date, group_columns, value_column):
+    """Mostra le metriche di flusso e di stock per i dati cumulativi"""
+    # BOX INFORMATIVO PER DATI CUMULATIVI
+    st.info("""
+    **ANALISI DEI FLUSSI MENSILI**  
+    I dati originali sono cumulativi annuali. Il flusso netto mensile è ottenuto sottraendo il valore di ogni mese dal precedente.  
+    **Metodologia:**  
+    - Flusso mensile = valore del mese corrente - valore del mese precedente  
+    - Mesi mancanti: utilizzato l'ultimo dato disponibile (forward fill)  
+    """)
+    
+    # Display metriche in tabs: ogni tab calcola (in cache) solo le proprie metriche
+    tab_flow, tab_stock = st.tabs(["Metriche Flussi", "Metriche Stock"])
+    
+    with tab_flow:
+        flow_metrics = compute_flow_metrics(filtered_data, group_columns, value_column, start_date, end_date)
+        if flow_metrics is None:
+            st.info("Nessun flusso calcolabile per il periodo selezionato.")
+        else:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric(
+                    label="Flusso totale nel periodo",
+                    value=f"{flow_metrics['total_flow']:,.0f}",
+                    help=f"Somma dei flussi netti da {start_date.strftime('%b %Y')} a {end_date.strftime('%b %Y')}"
+                )
+            
+            with col2:
+                st.metric(
+                    label="Numero di mesi",
+                    value=f"{flow_metrics['num_months']}",
+                    help="Mesi considerati nell'intervallo selezionato"
+                )
+            
+            with col3:
+                st.metric(
+                    label="Flusso mensile medio",
+                    value=f"{flow_metrics['avg_monthly_flow']:,.0f}",
+                    help="Media dei flussi mensili nel periodo"
+                )
+    
+    with tab_stock:
+        stock_metrics = compute_stock_metrics(filtered_data, value_column)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric(
+                label=f"Stock cumulativo al {stock_metrics['last_date'].strftime('%b %Y')}",
+                value=f"{stock_metrics['total_stock']:,.0f}",
+                help="Valore cumulativo originale all'ultimo mese del periodo"
+            )
+        
+        with col2:
+            st.metric(
+                label="Variazione nel periodo (selezionare 2 mesi nello stesso anno)",
+                value=f"{stock_metrics['pct_change']:+.1f}%",
+                help=f"Variazione percentuale da {stock_metrics['first_date'].strftime('%b %Y')} a {stock_metrics['last_date'].strftime('%b %Y')}"
+            )
+        
+        with col3:
+            st.metric(
+                label="Stock mensile medio",
+                value=f"{stock_metrics['avg_stock']:,.0f}",
+                help="Media dei valori cumulativi nei mesi del periodo"
+            )
+    
+    # Warning per valori negativi
+    if flow_metrics and flow_metrics['n_negative']:
+        st.warning(f"""
+        **Attenzione:** Sono presenti {flow_metrics['n_negative']} valori di flusso negativo nel periodo selezionato.  
+        Questo può essere dovuto a:  
+        - Correzioni retroattive nei dati originali (consolidamento)
+        - Diminuzioni effettive del numero di migranti
+        - Errori nel processo di estrazione dei dati
+        """)
+
+def render_nazionalita_metrics(filtered_data, start_date, end_date):
+    """Metriche per dati_nazionalita"""
+    render_cumulative_metrics(filtered_data, start_date, end_date, ['nazionalita'], 'migranti_sbarcati')
+
+def render_accoglienza_metrics(filtered_data, start_date, end_date):
+    """Metriche per dati_accoglienza"""
+    render_cumulative_metrics(filtered_data, start_date, end_date, ['regione'], 'totale_accoglienza')
+
+@st.cache_data(ttl=3600, hash_funcs={pd.DataFrame: _hash_dataframe})
+def compute_sbarchi_metrics(filtered_data, value_column='migranti_sbarcati'):
+    """Calcola le metriche per i dati giornalieri degli sbarchi"""
+    return {
+        'total_sbarchi': filtered_data[value_column].sum(),
+        'avg_daily': filtered_data[value_column].mean(),
+        'max_daily': filtered_data[value_column].max()
+    }
+
+def render_sbarchi_metrics(filtered_data, start_date, end_date):
+    """Metriche per dati_sbarchi"""
+    metrics = compute_sbarchi_metrics(filtered_data)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            label="Totale sbarchi nel periodo",
+            value=f"{metrics['total_sbarchi']:,.0f}",
+            help=f"Totale sbarchi da {start_date} a {end_date}"
+        )
+    
+    with col2:
+        st.metric(
+            label="Media giornaliera",
+            value=f"{metrics['avg_daily']:,.1f}",
+            help="Media di migranti sbarcati al giorno"
+        )
+    
+    with col3:
+        st.metric(
+            label="Massimo giornaliero",
+            value=f"{metrics['max_daily']:,.0f}",
+            help="Numero massimo di migranti sbarcati in un singolo giorno"
+        )
+
+# Funzione di rendering delle metriche per ciascun dataset
+RENDER_METRICS = {
+    'dati_nazionalita': render_nazionalita_metrics,
+    'dati_accoglienza': render_accoglienza_metrics,
+    'dati_sbarchi': render_sbarchi_metrics
+}
+
+def _set_selection(state_key, values):
+    """Callback dei pulsanti di selezione: aggiorna il session state prima del rerun"""
+    st.session_state[state_key] = values
+
+def multiselect_with_all(label, options, state_key, key_suffix, help=None):
+    """Multiselect con i pulsanti "Seleziona tutto"/"Deseleziona tutto" legati a st.session_state[state_key]"""
+    if state_key not in st.session_state:
+        st.session_state[state_key] = list(options)
+    
+    col_btn1, col_btn2 = st.columns([1, 1])
+    with col_btn1:
+        st.button("Seleziona tutto", key=f"select_all_{key_suffix}", type="secondary", use_container_width=True,
+                  on_click=_set_selection, args=(state_key, list(options)))
+    
+    with col_btn2:
+        st.button("Deseleziona tutto", key=f"deselect_all_{key_suffix}", type="secondary", use_container_width=True,
+                  on_click=_set_selection, args=(state_key, []))
+    
+    selected = st.multiselect(
+        label,
+        options=options,
+        default=st.session_state[state_key],
+        help=help
+    )
+    
+    if selected != st.session_state[state_key]:
+        st.session_state[state_key] = selected
+    
+    return selected
+
 # Sidebar - Filtri e configurazioni
 with st.sidebar:
     st.title("Filtri Dashboard")
@@ -956,10 +1169,10 @@ with st.sidebar:
             st.session_state.start_month = first_month
             st.session_state.end_year = last_year
             st.session_state.end_month = last_month
-            st.rerun()
         
         # Selettori anno/mese
         available_years = list(years_months_data.keys())
+        year_pos = {year: i for i, year in enumerate(available_years)}
         month_names = {
             1: "Gennaio", 2: "Febbraio", 3: "Marzo", 4: "Aprile",
             5: "Maggio", 6: "Giugno", 7: "Luglio", 8: "Agosto",
@@ -980,17 +1193,18 @@ with st.sidebar:
             start_year = st.selectbox(
                 "Anno",
                 options=available_years,
-                index=available_years.index(st.session_state.start_year) if st.session_state.start_year in available_years else 0,
+                index=year_pos.get(st.session_state.start_year, 0),
                 help="Seleziona l'anno di inizio",
                 key="start_year_select"
             )
             
             available_start_months = years_months_data.get(start_year, [])
+            start_month_pos = {month: i for i, month in enumerate(available_start_months)}
             start_month = st.selectbox(
                 "Mese",
                 options=available_start_months,
                 format_func=lambda x: month_names[x],
-                index=available_start_months.index(st.session_state.start_month) if st.session_state.start_month in available_start_months else 0,
+                index=start_month_pos.get(st.session_state.start_month, 0),
                 help="Seleziona il mese di inizio",
                 key="start_month_select"
             )
@@ -1000,25 +1214,25 @@ with st.sidebar:
             end_year = st.selectbox(
                 "Anno",
                 options=available_years,
-                index=available_years.index(st.session_state.end_year) if st.session_state.end_year in available_years else len(available_years)-1,
+                index=year_pos.get(st.session_state.end_year, len(available_years)-1),
                 help="Seleziona l'anno di fine",
                 key="end_year_select"
             )
             
             available_end_months = years_months_data.get(end_year, [])
+            end_month_pos = {month: i for i, month in enumerate(available_end_months)}
             end_month = st.selectbox(
                 "Mese",
                 options=available_end_months,
                 format_func=lambda x: month_names[x],
-                index=available_end_months.index(st.session_state.end_month) if st.session_state.end_month in available_end_months else len(available_end_months)-1,
+                index=end_month_pos.get(st.session_state.end_month, len(available_end_months)-1),
                 help="Seleziona il mese di fine",
                 key="end_month_select"
             )
         
         # Converti in date
-        start_date = date(start_year, start_month, 1)
-        end_date = date(end_year, end_month, 1) + timedelta(days=31)
-        end_date = end_date.replace(day=1) - timedelta(days=1)
+        start_date = pd.Period(year=start_year, month=start_month, freq='M').start_time
+        end_date = pd.Period(year=end_year, month=end_month, freq='M').end_time.floor('D')
         
         # Salva in session state
         st.session_state.selected_start_date = start_date
@@ -1051,111 +1265,48 @@ with st.sidebar:
     
     # Filtri specifici per dataset (NON MODIFICATI)
     if selected_table == 'dati_nazionalita':
-        nazionalita_data = load_table_data('dati_nazionalita')
-        nazionalita_list = sorted(nazionalita_data['nazionalita'].unique())
+        nazionalita_list = get_distinct('dati_nazionalita', 'nazionalita')
         
         st.markdown("**Filtra per nazionalità**")
         
-        col_btn1, col_btn2 = st.columns([1, 1])
-        with col_btn1:
-            if st.button("Seleziona tutto", key="select_all_naz", type="secondary", use_container_width=True):
-                if 'selected_nazionalita' not in st.session_state:
-                    st.session_state.selected_nazionalita = []
-                st.session_state.selected_nazionalita = nazionalita_list
-                st.rerun()
-        
-        with col_btn2:
-            if st.button("Deseleziona tutto", key="deselect_all_naz", type="secondary", use_container_width=True):
-                if 'selected_nazionalita' not in st.session_state:
-                    st.session_state.selected_nazionalita = []
-                st.session_state.selected_nazionalita = []
-                st.rerun()
-        
         if 'selected_nazionalita' not in st.session_state:
             if 'start_year' in st.session_state:
-                data_year = nazionalita_data[pd.to_datetime(nazionalita_data['data_riferimento']).dt.year == st.session_state.start_year]
-                totali_nazionalita = data_year.groupby('nazionalita')['migranti_sbarcati'].sum().reset_index()
-                top_5_nazionalita = totali_nazionalita.sort_values('migranti_sbarcati', ascending=False).head(5)['nazionalita'].tolist()
-                st.session_state.selected_nazionalita = top_5_nazionalita
+                st.session_state.selected_nazionalita = get_top_nazionalita(st.session_state.start_year)
             else:
-                st.session_state.selected_nazionalita = nazionalita_list[:5] if len(nazionalita_list) > 5 else nazionalita_list
+                st.session_state.selected_nazionalita = nazionalita_list[:5]
         
-        selected_nazionalita = st.multiselect(
+        selected_nazionalita = multiselect_with_all(
             " ",
             options=nazionalita_list,
-            default=st.session_state.selected_nazionalita,
+            state_key='selected_nazionalita',
+            key_suffix='naz',
             help="Seleziona le nazionalità da includere nell'analisi"
         )
-        
-        if selected_nazionalita != st.session_state.selected_nazionalita:
-            st.session_state.selected_nazionalita = selected_nazionalita
     
     elif selected_table == 'dati_accoglienza':
-        accoglienza_data = load_table_data('dati_accoglienza')
-        
         # Filtro per regione
         st.subheader("Filtra per regione")
-        regioni_list = sorted(accoglienza_data['regione'].unique())
+        regioni_list = get_distinct('dati_accoglienza', 'regione')
         
-        col_btn1, col_btn2 = st.columns([1, 1])
-        with col_btn1:
-            if st.button("Seleziona tutto", key="select_all_reg", type="secondary", use_container_width=True):
-                if 'selected_regioni' not in st.session_state:
-                    st.session_state.selected_regioni = []
-                st.session_state.selected_regioni = regioni_list
-                st.rerun()
-        
-        with col_btn2:
-            if st.button("Deseleziona tutto", key="deselect_all_reg", type="secondary", use_container_width=True):
-                if 'selected_regioni' not in st.session_state:
-                    st.session_state.selected_regioni = []
-                st.session_state.selected_regioni = []
-                st.rerun()
-        
-        if 'selected_regioni' not in st.session_state:
-            st.session_state.selected_regioni = regioni_list
-        
-        selected_regioni = st.multiselect(
+        selected_regioni = multiselect_with_all(
             "Regioni",
             options=regioni_list,
-            default=st.session_state.selected_regioni,
+            state_key='selected_regioni',
+            key_suffix='reg',
             help="Seleziona le regioni da includere nell'analisi"
         )
         
-        if selected_regioni != st.session_state.selected_regioni:
-            st.session_state.selected_regioni = selected_regioni
-        
         # Filtro per tipologia di accoglienza
         st.subheader("Filtra per tipologia di accoglienza")
         tipologie_list = ['Hot Spot', 'Centri Accoglienza', 'SIPROIMI/SAI']
         
-        col_btn3, col_btn4 = st.columns([1, 1])
-        with col_btn3:
-            if st.button("Seleziona tutto", key="select_all_tip", type="secondary", use_container_width=True):
-                if 'selected_tipologie' not in st.session_state:
-                    st.session_state.selected_tipologie = []
-                st.session_state.selected_tipologie = tipologie_list
-                st.rerun()
-        
-        with col_btn4:
-            if st.button("Deseleziona tutto", key="deselect_all_tip", type="secondary", use_container_width=True):
-                if 'selected_tipologie' not in st.session_state:
-                    st.session_state.selected_tipologie = []
-                st.session_state.selected_tipologie = []
-                st.rerun()
-        
-        if 'selected_tipologie' not in st.session_state:
-            st.session_state.selected_tipologie = tipologie_list
-        
-        selected_tipologie = st.multiselect(
+        selected_tipologie = multiselect_with_all(
             "Tipologie",
             options=tipologie_list,
-            default=st.session_state.selected_tipologie,
+            state_key='selected_tipologie',
+            key_suffix='tip',
             help="Seleziona le tipologie di accoglienza da includere nell'analisi"
         )
-        
-        if selected_tipologie != st.session_state.selected_tipologie:
-            st.session_state.selected_tipologie = selected_tipologie
 # Header principale
 st.title("Analisi del numero dei migranti sbarcati e dei migranti in accoglienza in Italia dal 2017")
 st.markdown("Analisi esplorativa dei dati estratti dai report del Ministero dell'Interno")
@@ -1180,158 +1331,10 @@ try:
     )
     
     if not filtered_data.empty:
-        # Determina tipo di dati
-        is_cumulative = selected_table in ['dati_nazionalita', 'dati_accoglienza']
-        is_sbarchi = selected_table == 'dati_sbarchi'
-        
-        # BOX INFORMATIVO PER DATI CUMULATIVI
-        if is_cumulative:
-            st.info("""
-            **ANALISI DEI FLUSSI MENSILI**  
-            I dati originali sono cumulativi annuali. Il flusso netto mensile è ottenuto sottraendo il valore di ogni mese dal precedente.  
-            **Metodologia:**  
-            - Flusso mensile = valore del mese corrente - valore del mese precedente  
-            - Mesi mancanti: utilizzato l'ultimo dato disponibile (forward fill)  
-            """)
-        
-        # Display metriche
-        if is_cumulative:
-            # Calcola flussi mensili
-            group_columns = ['nazionalita'] if selected_table == 'dati_nazionalita' else ['regione']
-            value_column = 'migranti_sbarcati' if selected_table == 'dati_nazionalita' else 'totale_accoglienza'
-            
-            flow_data = calculate_monthly_flow(
-                filtered_data,
-                group_columns=group_columns,
-                value_column=value_column
-            )
-            
-            if not flow_data.empty:
-                # Filtra per periodo selezionato
-                flow_data['data_completa'] = pd.to_datetime(
-                    flow_data['anno'].astype(str) + '-' + 
-                    flow_data['mese'].astype(str) + '-01'
-                )
-                flow_data = flow_data[
-                    (flow_data['data_completa'] >= pd.Timestamp(start_date)) & 
-                    (flow_data['data_completa'] <= pd.Timestamp(end_date))
-                ]
-                
-                # Calcola metriche flusso
-                total_flow = flow_data['flusso_mensile'].sum()
-                avg_monthly_flow = flow_data.groupby(['anno', 'mese'])['flusso_mensile'].sum().mean()
-                num_months = flow_data[['anno', 'mese']].drop_duplicates().shape[0]
-                max_flow = flow_data['flusso_mensile'].max()
-                min_flow = flow_data['flusso_mensile'].min()
-                
-                # Calcola metriche stock (dati originali)
-                # Prendi l'ultimo mese disponibile nel periodo
-                filtered_data['data_completa'] = pd.to_datetime(filtered_data['data_riferimento'])
-                filtered_data = filtered_data.sort_values('data_completa')
-                last_date = filtered_data['data_completa'].max()
-                last_month_data = filtered_data[filtered_data['data_completa'] == last_date]
-                total_stock = last_month_data[value_column].sum()
-                
-                # Display metriche in tabs
-                tab_flow, tab_stock = st.tabs(["Metriche Flussi", "Metriche Stock"])
-                
-                with tab_flow:
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.metric(
-                            label="Flusso totale nel periodo",
-                            value=f"{total_flow:,.0f}",
-                            help=f"Somma dei flussi netti da {start_date.strftime('%b %Y')} a {end_date.strftime('%b %Y')}"
-                        )
-                    
-                    with col2:
-                        st.metric(
-                            label="Numero di mesi",
-                            value=f"{num_months}",
-                            help="Mesi considerati nell'intervallo selezionato"
-                        )
-                    
-                    with col3:
-                        st.metric(
-                            label="Flusso mensile medio",
-                            value=f"{avg_monthly_flow:,.0f}",
-                            help="Media dei flussi mensili nel periodo"
-                        )
-                
-                with tab_stock:
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.metric(
-                            label=f"Stock cumulativo al {last_date.strftime('%b %Y')}",
-                            value=f"{total_stock:,.0f}",
-                            help="Valore cumulativo originale all'ultimo mese del periodo"
-                        )
-                    
-                    with col2:
-                        # Calcola variazione percentuale rispetto al primo mese del periodo
-                        first_date = filtered_data['data_completa'].min()
-                        first_month_data = filtered_data[filtered_data['data_completa'] == first_date]
-                        first_stock = first_month_data[value_column].sum()
-                        
-                        if first_stock > 0:
-                            pct_change = ((total_stock - first_stock) / first_stock) * 100
-                        else:
-                            pct_change = 0
-                        
-                        st.metric(
-                            label="Variazione nel periodo (selezionare 2 mesi nello stesso anno)",
-                            value=f"{pct_change:+.1f}%",
-                            help=f"Variazione percentuale da {first_date.strftime('%b %Y')} a {last_date.strftime('%b %Y')}"
-                        )
-                    
-                    with col3:
-                        # Media stock mensile
-                        avg_stock = filtered_data.groupby(['data_completa'])[value_column].sum().mean()
-                        st.metric(
-                            label="Stock mensile medio",
-                            value=f"{avg_stock:,.0f}",
-                            help="Media dei valori cumulativi nei mesi del periodo"
-                        )
-                
-                # Warning per valori negativi
-                negative_flows = flow_data[flow_data['flusso_mensile'] < 0]
-                if not negative_flows.empty:
-                    st.warning(f"""
-                    **Attenzione:** Sono presenti {len(negative_flows)} valori di flusso negativo nel periodo selezionato.  
-                    Questo può essere dovuto a:  
-                    - Correzioni retroattive nei dati originali (consolidamento)
-                    - Diminuzioni effettive del numero di migranti
-                    - Errori nel processo di estrazione dei dati
-                    """)
-        
-        elif is_sbarchi:
-            # Metriche per dati_sbarchi (non modificato)
-            value_column = 'migranti_sbarcati'
-            total_sbarchi = filtered_data[value_column].sum()
-            avg_daily = filtered_data[value_column].mean()
-            max_daily = filtered_data[value_column].max()
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric(
-                    label="Totale sbarchi nel periodo",
-                    value=f"{total_sbarchi:,.0f}",
-                    help=f"Totale sbarchi da {start_date} a {end_date}"
-                )
-            
-            with col2:
-                st.metric(
-                    label="Media giornaliera",
-                    value=f"{avg_daily:,.1f}",
-                    help="Media di migranti sbarcati al giorno"
-                )
-            
-            with col3:
-                st.metric(
-                    label="Massimo giornaliero",
-                    value=f"{max_daily:,.0f}",
-                    help="Numero massimo di migranti sbarcati in un singolo giorno"
-                )
+        # Display metriche (funzione di rendering specifica per dataset)
+        render_metrics = RENDER_METRICS.get(selected_table)
+        if render_metrics:
+            render_metrics(filtered_data, start_date, end_date)
         
         # Visualizzazioni specifiche per dataset
         st.header("Analisi Dettagliata")
@@ -1486,43 +1489,25 @@ try:
             with st.expander("Tabella riepilogativa flussi mensili"):
                 if 'selected_regioni' in st.session_state and st.session_state.selected_regioni:
                     # Calcola flussi per regione
-                    flow_data = calculate_monthly_flow(
+                    flow_data = _flow_for_range(
                         filtered_data,
-                        group_columns=['regione'],
-                        value_column='totale_accoglienza'
+                        group_columns=('regione',),
+                        value_column='totale_accoglienza',
+                        start_date=start_date,
+                        end_date=end_date
                     )
                     
                     if not flow_data.empty:
-                        flow_data['data_completa'] = pd.to_datetime(
-                            flow_data['anno'].astype(str) + '-' + 
-                            flow_data['mese'].astype(str) + '-01'
-                        )
-                        flow_data = flow_data[
-                            (flow_data['data_completa'] >= pd.Timestamp(start_date)) & 
-                            (flow_data['data_completa'] <= pd.Timestamp(end_date))
-                        ]
-                        
                         # Pivot table per visualizzazione
-                        pivot_table = flow_data.pivot_table(
-                            values='flusso_mensile',
-                            index='regione',
-                            columns=['anno', 'mese'],
-                            aggfunc='sum',
-                            fill_value=0
-                        )
-                        
-                        # Riformatta i nomi delle colonne
-                        pivot_table.columns = [f"{anno}-{mese:02d}" for anno, mese in pivot_table.columns]
-                        pivot_table = pivot_table.round(0)
+                        pivot_table = build_monthly_flow_pivot(flow_data, index_column='regione')
                         
                         st.dataframe(pivot_table, use_container_width=True)
                         
                         # Opzione download
-                        csv = pivot_table.to_csv()
                         st.download_button(
                             label="Scarica CSV flussi mensili",
-                            data=csv,
-                            file_name=f"flussi_accoglienza_{start_date}_{end_date}.csv",
+                            data=functools.partial(_df_to_csv, pivot_table, index=True),
+                            file_name=f"flussi_accoglienza_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}.csv",
                             mime="text/csv"
                         )
         
@@ -1549,18 +1534,18 @@ try:
             # Sezione dati grezzi per dati_sbarchi
             with st.expander("Dati Grezzi"):
                 if daily_data is not None:
-                    display_data = daily_data.sort_values('data_completa').copy()
-                    display_data = display_data.rename(columns={
+                    # daily_data esce già ordinato per data da create_daily_column_chart;
+                    # rename restituisce un nuovo DataFrame, non serve copiarlo
+                    display_data = daily_data.rename(columns={
                         'data_completa': 'Data',
                         'migranti_sbarcati': 'Migranti Sbarcati'
                     })
                     st.dataframe(display_data, use_container_width=True)
                     
-                    csv = display_data.to_csv(index=False)
                     st.download_button(
                         label="Scarica CSV",
-                        data=csv,
-                        file_name=f"{selected_table}_{start_date}_{end_date}.csv",
+                        data=functools.partial(_df_to_csv, display_data),
+                        file_name=f"{selected_table}_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}.csv",
                         mime="text/csv"
                     )
                 else:
@@ -1576,11 +1561,10 @@ try:
                     st.markdown("**Dati cumulativi originali dal Ministero**")
                     st.dataframe(filtered_data, use_container_width=True)
                     
-                    csv_original = filtered_data.to_csv(index=False)
                     st.download_button(
                         label="Scarica CSV dati originali",
-                        data=csv_original,
-                        file_name=f"{selected_table}_originali_{start_date}_{end_date}.csv",
+                        data=functools.partial(_df_to_csv, filtered_data),
+                        file_name=f"{selected_table}_originali_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}.csv",
                         mime="text/csv"
                     )
                 
@@ -1591,23 +1575,15 @@ try:
                     group_columns = ['nazionalita'] if selected_table == 'dati_nazionalita' else ['regione']
                     value_column = 'migranti_sbarcati' if selected_table == 'dati_nazionalita' else 'totale_accoglienza'
                     
-                    flow_data = calculate_monthly_flow(
+                    flow_data = _flow_for_range(
                         filtered_data,
-                        group_columns=group_columns,
-                        value_column=value_column
+                        group_columns=tuple(group_columns),
+                        value_column=value_column,
+                        start_date=start_date,
+                        end_date=end_date
                     )
                     
                     if not flow_data.empty:
-                        # Filtra per periodo
-                        flow_data['data_completa'] = pd.to_datetime(
-                            flow_data['anno'].astype(str) + '-' + 
-                            flow_data['mese'].astype(str) + '-01'
-                        )
-                        flow_data = flow_data[
-                            (flow_data['data_completa'] >= pd.Timestamp(start_date)) & 
-                            (flow_data['data_completa'] <= pd.Timestamp(end_date))
-                        ]
-                        
                         # Formatta per visualizzazione
                         display_flow = flow_data[[
                             'anno', 'mese', 
@@ -1624,11 +1600,10 @@ try:
                         
                         st.dataframe(display_flow, use_container_width=True)
                         
-                        csv_flow = display_flow.to_csv(index=False)
                         st.download_button(
                             label="Scarica CSV flussi calcolati",
-                            data=csv_flow,
-                            file_name=f"{selected_table}_flussi_{start_date}_{end_date}.csv",
+                            data=functools.partial(_df_to_csv, display_flow),
+                            file_name=f"{selected_table}_flussi_{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}.csv",
                             mime="text/csv"
                         )
                     else:
@@ -1,14 +1,83 @@
 # pdf_downloader.py
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import urllib.parse
+import calendar
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Tuple
-import time
+from typing import Dict, Iterator, Mapping, Tuple
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import json
 import os
+import shutil
+from email.utils import formatdate, parsedate_to_datetime
 
 from config.settings import config
 
+# URL dei mesi pubblicati con un nome file fuori schema (costante di modulo, sola lettura)
+_URL_SPECIALI: Mapping[Tuple[int, int], str] = MappingProxyType({
+    (2017, 1): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_gennaio_2017_3.pdf",
+    (2017, 2): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_28_febbraio_2017_2.pdf",
+    (2017, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_marzo_2017_2.pdf",
+    (2017, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_aprile_2017_3.pdf",
+    (2017, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_del_31_maggio_2017_1.pdf",
+    (2017, 6): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_del_30_giugno_2017_1.pdf",
+    (2017, 7): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_del_31_luglio_2017_1.pdf",
+    (2017, 8): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_agosto_2017_1.pdf",
+    (2017, 9): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_settembre_1.pdf",
+    (2017, 10): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_ottobre_2017_0.pdf",
+    (2017, 11): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_novembre_2017_0.pdf",
+    (2017, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2017_0.pdf",
+    (2018, 1): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_gennaio_2018.pdf",
+    (2018, 2): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_28_febbraio_2018.pdf",
+    (2018, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_marzo_2018.pdf",
+    (2018, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_aprile_2018.pdf",
+    (2018, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_maggio_2018.pdf",
+    (2018, 6): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_giugno_2018.pdf",
+    (2018, 7): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_luglio_2018.pdf",
+    (2018, 8): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_agosto_2018.pdf",
+    (2018, 9): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_settembre_2018.pdf",
+    (2018, 10): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_ottobre_2018.pdf",
+    (2018, 11): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_novembre_2018.pdf",
+    (2018, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2018.pdf",
+    (2019, 1): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31-01-2019_0_0.pdf",
+    (2019, 2): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_28-02-2019_0_0.pdf",
+    (2019, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31-03-2019_0.pdf",
+    (2019, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30-04-2019_0_0.pdf",
+    (2019, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31-05-2019_0.pdf",
+    (2019, 9): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30-09-2019_0.pdf",
+    (2020, 1): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_gennaio_2020.pdf",
+    (2020, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_marzo_2020.pdf",
+    (2020, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_maggio_2020.pdf",
+    (2020, 11): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_novembre_2020.pdf",
+    (2020, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2020_0.pdf",
+    (2021, 9): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_settembre_2021.pdf",
+    (2022, 2): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_28-02-2022_1.pdf",
+    (2022, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_aprile_2022.pdf",
+    (2022, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31-05-2022%20%281%29.pdf",
+    (2022, 11): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_novembre_2022.pdf",
+    (2022, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2022.pdf",
+    (2024, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31.03.2024.pdf",
+    (2024, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_aprile_2024.pdf",
+    (2024, 6): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2030%20giugno%202024.pdf",
+    (2024, 8): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2031%20agosto%202024.pdf",
+    (2024, 9): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2030%20settembre%202024.pdf",
+    (2024, 10): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2031%20ottobre%202024.pdf",
+    (2024, 11): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2030%20novembre%202024.pdf",
+    (2024, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2024.pdf",
+    (2025, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_21-05-2025.pdf",
+    (2025, 11): "/sites/default/files/2025-12/Cruscotto%20statistico%20giornaliero%2030-11-2025.pdf",
+})
+
+def _mesi_nel_periodo(anno_inizio: int, mese_inizio: int, anno_fine: int, mese_fine: int) -> Iterator[Tuple[int, int]]:
+    # Indice assoluto del mese (anno * 12 + mese - 1): un solo range, nessun controllo per iterazione
+    for indice in range(anno_inizio * 12 + mese_inizio - 1, anno_fine * 12 + mese_fine):
+        anno, mese_zero = divmod(indice, 12)
+        yield anno, mese_zero + 1
+
 class PDFDownloader:
     def __init__(self):
         self.base_url = config.BASE_URL
@@ -16,79 +85,43 @@ class PDFDownloader:
         self.save_path = config.PDF_SAVE_PATH
         self.timeout = config.DOWNLOAD_TIMEOUT
         self.max_retries = config.MAX_RETRIES
+        self.max_workers = config.DOWNLOAD_WORKERS
+        self.check_updates = config.CHECK_UPDATES
         
-        self.mesi_31_giorni = [1, 3, 5, 7, 8, 10, 12]
-        self.mesi_30_giorni = [4, 6, 9, 11]
+        # Sessione condivisa: riusa le connessioni keep-alive verso il server del Ministero
+        self.session = requests.Session()
+        # Riprova GET e HEAD su errori di rete, 429 e 5xx con attese esponenziali (0.5s, 1s, 2s, ...)
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        # Ogni mese può sondare in parallelo le 4 varianti del nome file
+        adapter = HTTPAdapter(
+            max_retries=retry,
+            pool_connections=self.max_workers,
+            pool_maxsize=self.max_workers * 4
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._print_lock = threading.Lock()
         
-        self.url_speciali = self._costruisci_url_speciali()
+        self.url_speciali = _URL_SPECIALI
         
         self.save_path.mkdir(parents=True, exist_ok=True)
-
-    def _costruisci_url_speciali(self) -> Dict[Tuple[int, int], str]:
-        return {
-            (2017, 1): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_gennaio_2017_3.pdf",
-            (2017, 2): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_28_febbraio_2017_2.pdf",
-            (2017, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_marzo_2017_2.pdf",
-            (2017, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_aprile_2017_3.pdf",
-            (2017, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_del_31_maggio_2017_1.pdf",
-            (2017, 6): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_del_30_giugno_2017_1.pdf",
-            (2017, 7): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_del_31_luglio_2017_1.pdf",
-            (2017, 8): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_agosto_2017_1.pdf",
-            (2017, 9): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_settembre_1.pdf",
-            (2017, 10): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_ottobre_2017_0.pdf",
-            (2017, 11): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_novembre_2017_0.pdf",
-            (2017, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2017_0.pdf",
-            (2018, 1): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_gennaio_2018.pdf",
-            (2018, 2): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_28_febbraio_2018.pdf",
-            (2018, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_marzo_2018.pdf",
-            (2018, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_aprile_2018.pdf",
-            (2018, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_maggio_2018.pdf",
-            (2018, 6): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_giugno_2018.pdf",
-            (2018, 7): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_luglio_2018.pdf",
-            (2018, 8): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_agosto_2018.pdf",
-            (2018, 9): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_settembre_2018.pdf",
-            (2018, 10): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_ottobre_2018.pdf",
-            (2018, 11): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_novembre_2018.pdf",
-            (2018, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2018.pdf",
-            (2019, 1): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31-01-2019_0_0.pdf",
-            (2019, 2): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_28-02-2019_0_0.pdf",
-            (2019, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31-03-2019_0.pdf",
-            (2019, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30-04-2019_0_0.pdf",
-            (2019, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31-05-2019_0.pdf",
-            (2019, 9): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30-09-2019_0.pdf",
-            (2020, 1): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_gennaio_2020.pdf",
-            (2020, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_marzo_2020.pdf",
-            (2020, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_maggio_2020.pdf",
-            (2020, 11): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_novembre_2020.pdf",
-            (2020, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2020_0.pdf",
-            (2021, 9): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_settembre_2021.pdf",
-            (2022, 2): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_28-02-2022_1.pdf",
-            (2022, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_aprile_2022.pdf",
-            (2022, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31-05-2022%20%281%29.pdf",
-            (2022, 11): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_novembre_2022.pdf",
-            (2022, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2022.pdf",
-            (2024, 3): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31.03.2024.pdf",
-            (2024, 4): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_30_aprile_2024.pdf",
-            (2024, 6): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2030%20giugno%202024.pdf",
-            (2024, 8): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2031%20agosto%202024.pdf",
-            (2024, 9): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2030%20settembre%202024.pdf",
-            (2024, 10): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2031%20ottobre%202024.pdf",
-            (2024, 11): "/sites/default/files/2025-05/Cruscotto%20statistico%20al%2030%20novembre%202024.pdf",
-            (2024, 12): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_31_dicembre_2024.pdf",
-            (2025, 5): "/sites/default/files/2025-05/cruscotto_statistico_giornaliero_21-05-2025.pdf",
-            (2025, 11): "/sites/default/files/2025-12/Cruscotto%20statistico%20giornaliero%2030-11-2025.pdf",
-        }
+        
+        # Manifest su disco {"anno-mese": filename} dei mesi già scaricati
+        self.manifest_path = self.save_path / "manifest.json"
+        self._manifest = self._carica_manifest()
+        self._manifest_lock = threading.Lock()
+        
+        # Elenco dei PDF locali memorizzato come (mtime_ns della cartella, nomi ordinati)
+        self._elenco_pdf = None
 
     def get_ultimo_giorno_mese(self, anno: int, mese: int) -> int:
-        if mese in self.mesi_31_giorni:
-            return 31
-        elif mese in self.mesi_30_giorni:
-            return 30
-        else:
-            if (anno % 4 == 0 and anno % 100 != 0) or (anno % 400 == 0):
-                return 29
-            else:
-                return 28
+        return calendar.monthrange(anno, mese)[1]
 
     def get_cartella_per_mese(self, anno: int, mese: int) -> str:
         if anno < 2025:
@@ -103,33 +136,115 @@ class PDFDownloader:
         else:
             return "2025-12"
 
+    def _carica_manifest(self) -> Dict[str, str]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _registra_nel_manifest(self, anno: int, mese: int, filename: str):
+        with self._manifest_lock:
+            self._manifest[f"{anno}-{mese}"] = filename
+            # Scrittura atomica: file temporaneo + os.replace
+            tmp_path = self.manifest_path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._manifest, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+
+    def _log(self, message: str):
+        # I download girano su più thread: evita righe di output mescolate
+        with self._print_lock:
+            print(message)
+
+    def _probe(self, url: str) -> bool:
+        # HEAD senza corpo: False solo se il server conferma che il file non c'è
+        try:
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            return response.status_code not in (404, 410)
+        except Exception:
+            return True
+
+    def _copia_aggiornata(self, url: str, filepath: Path) -> bool:
+        # HEAD condizionale sulla data della copia locale: 304 se il file sul server non è cambiato
+        headers = {'If-Modified-Since': formatdate(filepath.stat().st_mtime, usegmt=True)}
+        try:
+            response = self.session.head(url, headers=headers, timeout=self.timeout, allow_redirects=True)
+        except Exception:
+            # Server non raggiungibile: si tiene la copia locale
+            return True
+        
+        if response.status_code != 200:
+            return True
+        
+        # Alcuni server ignorano If-Modified-Since sulle HEAD: confronta Last-Modified
+        last_modified = response.headers.get('Last-Modified')
+        if not last_modified:
+            return True
+        try:
+            return parsedate_to_datetime(last_modified).timestamp() <= filepath.stat().st_mtime
+        except (TypeError, ValueError):
+            return True
+
     def download_pdf(self, url: str, filename: str) -> bool:
         filepath = self.save_path / filename
         
         if filepath.exists():
-            print(f"File già esistente: {filename}")
-            return True
+            if not self.check_updates or self._copia_aggiornata(url, filepath):
+                self._log(f"File già esistente: {filename}")
+                return True
+            self._log(f"File aggiornato sul server, nuovo download: {filename}")
         
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.get(url, timeout=self.timeout)
+        tmp_path = filepath.with_name(filepath.name + '.part')
+        # I tentativi con backoff esponenziale sono gestiti dall'adapter della sessione
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
                 if response.status_code == 200:
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
+                    # Scrive su un file .part e lo rinomina solo a download completo
+                    response.raw.decode_content = True
+                    with open(tmp_path, 'wb') as f:
+                        shutil.copyfileobj(response.raw, f, 64 * 1024)
+                    os.replace(tmp_path, filepath)
+                    self._imposta_data_server(filepath, response.headers.get('Last-Modified'))
                     file_size = filepath.stat().st_size
-                    print(f"Scaricato: {filename} ({file_size} bytes)")
+                    self._log(f"Scaricato: {filename} ({file_size} bytes)")
                     return True
                 else:
-                    print(f"HTTP {response.status_code} per {filename}")
-            except Exception as e:
-                print(f"Tentativo {attempt + 1} fallito per {filename}: {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(1)
+                    self._log(f"HTTP {response.status_code} per {filename}")
+        except Exception as e:
+            self._log(f"Download fallito per {filename}: {e}")
         
+        # Nessun file parziale resta nella cartella dei PDF
+        tmp_path.unlink(missing_ok=True)
         return False
 
+    def _imposta_data_server(self, filepath: Path, last_modified):
+        # La mtime locale diventa la data del server: è il riferimento per If-Modified-Since
+        if not last_modified:
+            return
+        try:
+            timestamp = parsedate_to_datetime(last_modified).timestamp()
+        except (TypeError, ValueError):
+            return
+        os.utime(filepath, (timestamp, timestamp))
+
+    def _url_per_file(self, anno: int, mese: int, filename: str) -> str:
+        if (anno, mese) in self.url_speciali:
+            url_relativo = self.url_speciali[(anno, mese)]
+            if Path(urllib.parse.unquote(url_relativo)).name == filename:
+                return self.dominio_base + url_relativo
+        return f"{self.base_url}/{self.get_cartella_per_mese(anno, mese)}/{filename}"
+
     def process_mese(self, anno: int, mese: int) -> bool:
-        print(f"Processando {anno}-{mese:02d}")
+        # Mese già scaricato in un'esecuzione precedente
+        nome_registrato = self._manifest.get(f"{anno}-{mese}")
+        if nome_registrato and (self.save_path / nome_registrato).exists():
+            if not self.check_updates:
+                return True
+            # Verifica con una HEAD condizionale se il Ministero ha ripubblicato il file
+            return self.download_pdf(self._url_per_file(anno, mese, nome_registrato), nome_registrato)
+        
+        self._log(f"Processando {anno}-{mese:02d}")
         
         if (anno, mese) in self.url_speciali:
             url_relativo = self.url_speciali[(anno, mese)]
@@ -137,6 +252,7 @@ class PDFDownloader:
             nome_file = Path(urllib.parse.unquote(url_relativo)).name
             
             if self.download_pdf(url_completo, nome_file):
+                self._registra_nel_manifest(anno, mese, nome_file)
                 return True
         
         giorno = self.get_ultimo_giorno_mese(anno, mese)
@@ -149,12 +265,23 @@ class PDFDownloader:
             f"cruscotto_statistico_giornaliero_{giorno}_{mese}_{anno}.pdf",
         ]
         
-        for variante in varianti:
-            url = f"{self.base_url}/{cartella}/{variante}"
-            if self.download_pdf(url, variante):
+        urls = [f"{self.base_url}/{cartella}/{variante}" for variante in varianti]
+        
+        for url, variante in zip(urls, varianti):
+            if (self.save_path / variante).exists() and self.download_pdf(url, variante):
+                self._registra_nel_manifest(anno, mese, variante)
                 return True
         
-        print(f"Nessuna variante trovata per {anno}-{mese:02d}")
+        # Sonda le varianti in parallelo con HEAD e scarica solo quelle presenti sul server
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            presenti = list(executor.map(self._probe, urls))
+        
+        for url, variante, presente in zip(urls, varianti, presenti):
+            if presente and self.download_pdf(url, variante):
+                self._registra_nel_manifest(anno, mese, variante)
+                return True
+        
+        self._log(f"Nessuna variante trovata per {anno}-{mese:02d}")
         return False
 
     def download_all_pdfs(self, start_year: int = 2017, start_month: int = 1) -> Dict[str, int]:
@@ -173,19 +300,14 @@ class PDFDownloader:
         
         print(f"Download PDF da {start_month:02d}/{start_year} a {mese_fine:02d}/{anno_fine}")
         
-        success_count = 0
-        total_count = 0
+        mesi_da_scaricare = list(_mesi_nel_periodo(start_year, start_month, anno_fine, mese_fine))
+        
+        # I mesi sono indipendenti: li scarica in parallelo sulla sessione condivisa
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            risultati = list(executor.map(lambda periodo: self.process_mese(*periodo), mesi_da_scaricare))
         
-        for anno in range(start_year, anno_fine + 1):
-            for mese in range(1, 13):
-                if anno == start_year and mese < start_month:
-                    continue
-                if anno == anno_fine and mese > mese_fine:
-                    break
-                
-                total_count += 1
-                if self.process_mese(anno, mese):
-                    success_count += 1
+        total_count = len(risultati)
+        success_count = sum(risultati)
         
         print(f"\n{'='*50}")
         print(f"RIEPILOGO DOWNLOAD")
@@ -202,5 +324,9 @@ class PDFDownloader:
         }
 
     def get_downloaded_files(self) -> list:
-        pdf_files = list(self.save_path.glob("*.pdf"))
-        return sorted([f.name for f in pdf_files])
+        # Rilegge la cartella solo se la sua mtime è cambiata (file aggiunti, rinominati o rimossi)
+        mtime_ns = self.save_path.stat().st_mtime_ns
+        if self._elenco_pdf is None or self._elenco_pdf[0] != mtime_ns:
+            pdf_files = list(self.save_path.glob("*.pdf"))
+            self._elenco_pdf = (mtime_ns, sorted([f.name for f in pdf_files]))
+        return list(self._elenco_pdf[1])
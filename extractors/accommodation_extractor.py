@@ -4,11 +4,161 @@ import pandas as pd
 from pathlib import Path
 from typing import Optional, List
 import re
+import functools
+import logging
 from datetime import datetime
 
 from extractors.base_extractor import BaseExtractor
 from utils.file_utils import DateExtractor, DataProcessor
 
+# Messaggi per singolo PDF a livello DEBUG: nessun costo di formattazione se il livello è disattivo
+logger = logging.getLogger(__name__)
+
+# Espressioni regolari compilate una volta al caricamento del modulo
+_NON_DIGIT_RE = re.compile(r'[^\d]')
+_TITLE_RE = re.compile(r'PRESENZ[AE]\s*(?:MIGRANTI)?\s*IN\s*ACCOGLIENZA', re.IGNORECASE)
+_TITLE_2025_RE = re.compile(r'PRESENZ[AE].*ACCOGLIENZA.*\d{2}/\d{2}/\d{4}')
+# Righe di testo "Regione Totale Percentuale%" (pre-2019)
+_PRE_2019_LINE_RE = re.compile(r'^([A-Za-z\s\-\']+?)\s+(\d{1,3}(?:\.\d{3})*)\s*(\d+,\d+)?%?\s*$')
+# Righe di testo "Regione HotSpot Centri SAI Totale" (post-2019)
+_POST_2019_LINE_RE = re.compile(r'^([A-Za-z\s\-\']+?)\s+(\d*)\s+(\d{1,3}(?:\.\d{3})*)\s+(\d{1,3}(?:\.\d{3})*)\s+(\d{1,3}(?:\.\d{3})*)\s*$')
+
+# Regioni italiane (e varianti) usate per validare la prima colonna delle tabelle
+_REGIONI_ITALIANE = frozenset({
+    'abruzzo', 'basilicata', 'calabria', 'campania', 'emilia-romagna',
+    'friuli-venezia giulia', 'lazio', 'liguria', 'lombardia', 'marche',
+    'molise', 'piemonte', 'puglia', 'sardegna', 'sicilia', 'toscana',
+    'trentino-alto adige', 'umbria', "valle d'aosta", 'veneto',
+    'trentino alto adige', 'friuli venezia giulia', 'valle d aosta',
+    'emilia romagna', 'trentino-alto adige/südtirol'
+})
+
+# Sottostringhe delle righe da saltare (titolo, intestazioni, totali, note)
+_SKIP_PATTERNS = (
+    "presenze migranti", "presenza migranti", "totale",
+    "aggiornamento", "regione", "note", "fonte"
+)
+_SKIP_PATTERNS_PRE_2019 = _SKIP_PATTERNS + ("percentuale",)
+
+# Keyword (cercate come sottostringhe) per identificare le regioni
+_STRONG_KEYWORDS = (
+    'lombardia', 'lazio', 'campania', 'sicilia', 'veneto', 'piemonte',
+    'toscana', 'puglia', 'emilia', 'sardegna', 'calabria', 'liguria',
+    'abruzzo', 'marche', 'umbria', 'molise', 'basilicata', 'trentino',
+    'alto adige', 'friuli', 'valle', 'aosta'
+)
+
+# Indicatori testuali del formato pre-2019
+_PRE_2019_INDICATORS = (
+    "Totale immigrati presenti sul territorio regione",
+    "percentuale di distribuzione",
+    "Percentuale di distribuzione",
+)
+
+# Titoli che identificano la pagina della tabella accoglienza
+_TITLE_INDICATORS = (
+    'PRESENZE MIGRANTI IN ACCOGLIENZA',
+    'PRESENZA MIGRANTI IN ACCOGLIENZA',
+    'PRESENZE IN ACCOGLIENZA',
+    'PRESENZA IN ACCOGLIENZA',
+    'PRESENZE MIGRANTI',
+    'PRESENZA MIGRANTI',
+    'MIGRANTI IN ACCOGLIENZA',
+    'PRESENZE MIGRANTI ACCOGLIENZA',  # Aggiunto per robustezza
+    'PRESENZA MIGRANTI ACCOGLIENZA',  # Aggiunto per robustezza
+)
+
+# Le 20 regioni con i nomi normalizzati, per segnalare quelle mancanti nel report
+_TUTTE_REGIONI = frozenset({
+    'Abruzzo', 'Basilicata', 'Calabria', 'Campania', 'Emilia-Romagna',
+    'Friuli-Venezia Giulia', 'Lazio', 'Liguria', 'Lombardia', 'Marche',
+    'Molise', 'Piemonte', 'Puglia', 'Sardegna', 'Sicilia', 'Toscana',
+    'Trentino-Alto Adige', 'Umbria', 'Valle D\'Aosta', 'Veneto'
+})
+
+# Colonne numeriche della tabella accoglienza
+_NUMERIC_COLUMNS = [
+    'migranti_hot_spot', 'migranti_centri_accoglienza',
+    'migranti_siproimi_sai', 'totale_accoglienza'
+]
+
+# Colonne della tabella estratta (prima dei metadati)
+_TABLE_COLUMNS = ['regione'] + _NUMERIC_COLUMNS
+
+# Parole delle righe di testo da saltare (intestazioni e totali) nell'analisi testuale
+_TEXT_SKIP_PRE_2019 = ('presenz', 'regione', 'totale', 'aggiornamento')
+_TEXT_SKIP_POST_2019 = ('presenz', 'regione', 'hot', 'centri')
+
+# Varianti dei nomi regione (in maiuscolo) -> nome normalizzato
+_REGION_MAPPING = {
+    'TRENTINO-ALTO ADIGE/SÃ¼DTIROL': 'Trentino-Alto Adige',
+    'TRENTINO-ALTO ADIGE/SÜDTIROL': 'Trentino-Alto Adige',
+    'TRENTINO-ALTO ADIGE/SUDTIROL': 'Trentino-Alto Adige',
+    'TRENTINO-ALTO ADIGE': 'Trentino-Alto Adige',
+    'TRENTINO ALTO ADIGE': 'Trentino-Alto Adige',
+    'TRENTINO': 'Trentino-Alto Adige',
+    'ALTO ADIGE': 'Trentino-Alto Adige',
+
+    'VALLE D\'AOSTA': 'Valle D\'Aosta',
+    'VALLE D\'AOSTA/VALLÃ©E D\'AOSTE': 'Valle D\'Aosta',
+    'VALLE D\'AOSTA/VALLÉE D\'AOSTE': 'Valle D\'Aosta',
+    'VALLE D AOSTA/VALLEE D AOSTE': 'Valle D\'Aosta',
+    'VALLE D AOSTA': 'Valle D\'Aosta',
+    'VALLE DAOSTA': 'Valle D\'Aosta',
+    'VALLE D\'AOSTA/VALLEE D\'AOSTE': 'Valle D\'Aosta',
+
+    'FRIULI-VENEZIA GIULIA': 'Friuli-Venezia Giulia',
+    'FRIULI VENEZIA GIULIA': 'Friuli-Venezia Giulia',
+    'FRIULI': 'Friuli-Venezia Giulia',
+
+    'EMILIA-ROMAGNA': 'Emilia-Romagna',
+    'EMILIA ROMAGNA': 'Emilia-Romagna',
+
+    'PUGLIE': 'Puglia',
+    'TOSCANE': 'Toscana',
+    'LOMBARDIE': 'Lombardia'
+}
+
+
+# Alternanze compilate: una sola scansione della stringa per tutto l'insieme di sottostringhe
+_SKIP_RE = re.compile('|'.join(map(re.escape, _SKIP_PATTERNS)))
+_SKIP_PRE_2019_RE = re.compile('|'.join(map(re.escape, _SKIP_PATTERNS_PRE_2019)))
+_STRONG_KEYWORDS_RE = re.compile('|'.join(map(re.escape, _STRONG_KEYWORDS)))
+_TITLE_ANY_RE = re.compile(
+    '|'.join([*map(re.escape, _TITLE_INDICATORS), _TITLE_RE.pattern, _TITLE_2025_RE.pattern]),
+    re.IGNORECASE
+)
+
+# Tabella di traduzione per la normalizzazione delle etichette: una sola passata sulla stringa
+_NORM_TABLE = str.maketrans({'-': ' ', "'": None, '.': None, '/': ' ', 'ü': 'u'})
+
+
+@functools.lru_cache(maxsize=1024)
+def _is_region_label(regione_lower: str, is_pre_2019: bool) -> bool:
+    """Indica se l'etichetta di riga è una regione (o un totale da tenere); memoizzata sull'etichetta"""
+    skip_re = _SKIP_PRE_2019_RE if is_pre_2019 else _SKIP_RE
+    if skip_re.search(regione_lower):
+        return False
+    
+    # Verifica che sia una regione italiana valida
+    # La sequenza mojibake "Ã¼" ha due caratteri e va sostituita prima della tabella
+    regione_normalized = regione_lower.replace("Ã¼", "u").translate(_NORM_TABLE)
+    
+    # Controlla se almeno una parola della regione corrisponde
+    if any(word in _REGIONI_ITALIANE for word in regione_normalized.split() if len(word) > 3):
+        return True
+    if regione_normalized in _REGIONI_ITALIANE:
+        return True
+    return _STRONG_KEYWORDS_RE.search(regione_lower) is not None
+
+
+def _normalize_region_name(regione: str) -> str:
+    """Normalizza un nome regione: maiuscolo, mapping delle varianti e title-case"""
+    regione_upper = regione.upper()
+    # I valori del mapping sono già in title-case
+    mapped = _REGION_MAPPING.get(regione_upper)
+    return mapped if mapped is not None else regione_upper.title()
+
 
 class AccommodationExtractor(BaseExtractor):
     """Estrattore per i dati dei migranti in accoglienza (pre e post giugno 2019)"""
@@ -19,131 +169,131 @@ class AccommodationExtractor(BaseExtractor):
     def extract_from_single_pdf(self, pdf_path: Path) -> Optional[pd.DataFrame]:
         """Estrae i dati dell'accoglienza da un singolo PDF"""
         try:
-            print(f"Processando: {pdf_path.name}")
+            logger.debug("Processando: %s", pdf_path.name)
             
-            # Trova la pagina con la tabella dell'accoglienza
-            page_num = self._find_table_page(pdf_path)
-            if page_num is None:
-                print(f"  Tabella accoglienza non trovata in {pdf_path.name}")
-                return None
+            # Il PDF viene aperto una sola volta e passato ai metodi di supporto
+            with pdfplumber.open(pdf_path) as pdf:
+                # Testo delle pagine già estratto, riusato da tutti i controlli sul file
+                page_texts = {}
+                
+                # Trova la pagina con la tabella dell'accoglienza
+                candidates = self._find_candidate_pages(pdf_path)
+                page_num = self._find_table_page(pdf, pdf_path.name, page_texts, candidates)
+                if page_num is None and candidates is not None:
+                    # Filtro PyMuPDF senza esito: scansione completa con pdfplumber
+                    page_num = self._find_table_page(pdf, pdf_path.name, page_texts)
+                if page_num is None:
+                    logger.info("Tabella accoglienza non trovata in %s", pdf_path.name)
+                    return None
 
-            print(f"  Trovata tabella accoglienza a pagina {page_num}")
+                logger.debug("Trovata tabella accoglienza a pagina %d", page_num)
 
-            # Determina se è formato pre o post 2019
-            is_pre_2019 = self._is_pre_2019_format(pdf_path, page_num)
-            print(f"  Formato: {'pre-2019' if is_pre_2019 else 'post-2019'}")
+                # Libera il layout delle pagine già scansionate: serve solo quello della pagina della tabella
+                for scanned_num in page_texts:
+                    if scanned_num != page_num:
+                        pdf.pages[scanned_num].flush_cache()
 
-            # Estrae i dati dalla tabella
-            with pdfplumber.open(pdf_path) as pdf:
+                # Determina se è formato pre o post 2019
+                is_pre_2019 = self._is_pre_2019_format(page_texts[page_num], pdf_path.name)
+                logger.debug("Formato: %s", 'pre-2019' if is_pre_2019 else 'post-2019')
+
+                # Estrae i dati dalla tabella
                 page = pdf.pages[page_num]
                 table_data = self._extract_table_data(page, pdf_path.name, is_pre_2019)
                 
                 if table_data is not None and not table_data.empty:
                     processed_data = self._process_table_data(table_data, pdf_path.name, is_pre_2019)
-                    print(f"  Estrazione riuscita: {len(processed_data)} regioni")
+                    logger.debug("Estrazione riuscita: %d regioni", len(processed_data))
                     return processed_data
                 else:
-                    print(f"  Nessun dato estratto da {pdf_path.name}")
+                    logger.info("Nessun dato estratto da %s", pdf_path.name)
                     return None
                     
         except Exception as e:
-            print(f"Errore nell'elaborazione di {pdf_path.name}: {e}")
+            logger.error("Errore nell'elaborazione di %s: %s", pdf_path.name, e)
             return None
 
-    def _is_pre_2019_format(self, pdf_path: Path, page_num: int) -> bool:
+    def _find_candidate_pages(self, pdf_path: Path) -> Optional[set]:
+        """Pagine che possono contenere la tabella, lette con PyMuPDF (None se non disponibile)"""
+        return self._pages_containing(pdf_path, ('ACCOGLIENZA', 'PRESENZ', 'TOTALEIMMIGRATIPRESENTI'))
+
+    def _get_page_text(self, pdf, page_num: int, page_texts: dict) -> str:
+        """Restituisce il testo della pagina, estraendolo una sola volta per file"""
+        if page_num not in page_texts:
+            page_texts[page_num] = pdf.pages[page_num].extract_text()
+        return page_texts[page_num]
+
+    def _is_pre_2019_format(self, text: Optional[str], filename: str) -> bool:
         """Determina se la tabella è in formato pre-2019 (3 colonne)"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                page = pdf.pages[page_num]
-                text = page.extract_text()
-                
-                if text:
-                    # Cerca indicatori del formato pre-2019
-                    pre_2019_indicators = [
-                        "Totale immigrati presenti sul territorio regione",
-                        "percentuale di distribuzione",
-                        "Percentuale di distribuzione"
-                    ]
-                    
-                    if any(indicator in text for indicator in pre_2019_indicators):
-                        return True
-                    
-                    # Controlla anche la data del file
-                    date_str = DateExtractor.extract_date_from_filename(pdf_path.name)
-                    if date_str != "Data_non_riconosciuta":
-                        try:
-                            file_date = datetime.strptime(date_str, '%Y-%m-%d')
-                            if file_date < datetime(2019, 6, 1):
-                                return True
-                            # Se la data è 2025, sicuramente è formato post-2019
-                            if file_date.year == 2025:
-                                return False
-                        except ValueError:
-                            pass
+            if text:
+                # Cerca indicatori del formato pre-2019
+                if any(indicator in text for indicator in _PRE_2019_INDICATORS):
+                    return True
                 
-                return False
+                # Controlla anche la data del file
+                date_str = DateExtractor.extract_date_from_filename(filename)
+                if date_str != "Data_non_riconosciuta":
+                    try:
+                        file_date = datetime.strptime(date_str, '%Y-%m-%d')
+                        if file_date < datetime(2019, 6, 1):
+                            return True
+                        # Se la data è 2025, sicuramente è formato post-2019
+                        if file_date.year == 2025:
+                            return False
+                    except ValueError:
+                        pass
+            
+            return False
         except Exception as e:
-            print(f"Errore nel determinare il formato del file {pdf_path.name}: {e}")
+            logger.error("Errore nel determinare il formato del file %s: %s", filename, e)
             # In caso di errore, assume formato post-2019 per sicurezza
             return False
 
-    def _find_table_page(self, pdf_path: Path) -> Optional[int]:
+    def _find_table_page(self, pdf, filename: str, page_texts: dict, candidates: Optional[set] = None) -> Optional[int]:
         """Trova la pagina con la tabella delle presenze in accoglienza"""
-        title_indicators = [
-            'PRESENZE MIGRANTI IN ACCOGLIENZA',
-            'PRESENZA MIGRANTI IN ACCOGLIENZA',
-            'PRESENZE IN ACCOGLIENZA',
-            'PRESENZA IN ACCOGLIENZA',
-            'PRESENZE MIGRANTI',
-            'PRESENZA MIGRANTI',
-            'MIGRANTI IN ACCOGLIENZA',
-            'PRESENZE MIGRANTI ACCOGLIENZA',  # Aggiunto per robustezza
-            'PRESENZA MIGRANTI ACCOGLIENZA',  # Aggiunto per robustezza
-        ]
-
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                # Prima cerca con gli indicatori esatti
-                for page_num in range(len(pdf.pages)):
-                    page = pdf.pages[page_num]
-                    text = page.extract_text()
-                    
-                    if text:
-                        text_upper = text.upper()
-                        # Cerca con gli indicatori del titolo
-                        if any(indicator.upper() in text_upper for indicator in title_indicators):
-                            return page_num
-                        # Cerca con regex
-                        if re.search(r'PRESENZ[AE]\s*(MIGRANTI)?\s*IN\s*ACCOGLIENZA', text_upper, re.IGNORECASE):
-                            return page_num
-                        # Cerca anche tabelle che contengono le colonne tipiche per post-2019
-                        if all(keyword in text_upper for keyword in ['REGIONE', 'HOT SPOT', 'ACCOGLIENZA']):
-                            return page_num
-                        # Per i file pre-2019, cerca indicatori specifici
-                        if all(keyword in text_upper for keyword in ['REGIONE', 'TOTALE IMMIGRATI PRESENTI']):
-                            return page_num
-                        # Cerca pattern per file 2025
-                        if re.search(r'PRESENZ[AE].*ACCOGLIENZA.*\d{2}/\d{2}/\d{4}', text_upper):
-                            return page_num
+            # Pagine che superano il filtro rapido, riusate dalla ricerca generica
+            candidate_pages = []
             
-            # Se non trova con gli indicatori esatti, prova con approccio più generico
+            # Prima cerca con gli indicatori esatti
             for page_num in range(len(pdf.pages)):
-                page = pdf.pages[page_num]
-                text = page.extract_text()
+                # Pagine già escluse dalla lettura rapida con PyMuPDF
+                if candidates is not None and page_num not in candidates:
+                    continue
+                
+                text = self._get_page_text(pdf, page_num, page_texts)
                 
                 if text:
-                    # Cerca pattern più generici
                     text_upper = text.upper()
-                    if 'ACCOGLIENZA' in text_upper and ('MIGRANTI' in text_upper or 'PRESENZ' in text_upper):
-                        # Verifica che ci siano indicatori di tabella
-                        if 'REGIONE' in text_upper and any(word in text_upper for word in ['TOTALE', 'HOT', 'CENTRI']):
-                            return page_num
+                    # Filtro rapido: tutti i controlli richiedono almeno una di queste sottostringhe
+                    if ('ACCOGLIENZA' not in text_upper and 'PRESENZ' not in text_upper
+                            and 'TOTALE IMMIGRATI PRESENTI' not in text_upper):
+                        continue
+                    candidate_pages.append((page_num, text_upper))
+                    
+                    # Indicatori del titolo, regex del titolo e pattern dei file 2025 in una sola scansione
+                    if _TITLE_ANY_RE.search(text_upper):
+                        return page_num
+                    # Colonne tipiche della tabella: post-2019 (hot spot) o pre-2019 (totale immigrati)
+                    if 'REGIONE' in text_upper and (
+                            ('HOT SPOT' in text_upper and 'ACCOGLIENZA' in text_upper)
+                            or 'TOTALE IMMIGRATI PRESENTI' in text_upper):
+                        return page_num
             
-            print(f"  Nessuna tabella accoglienza trovata in {pdf_path.name}")
+            # Se non trova con gli indicatori esatti, prova con approccio più generico
+            for page_num, text_upper in candidate_pages:
+                # Cerca pattern più generici
+                if 'ACCOGLIENZA' in text_upper and ('MIGRANTI' in text_upper or 'PRESENZ' in text_upper):
+                    # Verifica che ci siano indicatori di tabella
+                    if 'REGIONE' in text_upper and any(word in text_upper for word in ['TOTALE', 'HOT', 'CENTRI']):
+                        return page_num
+            
+            logger.debug("Nessuna tabella accoglienza trovata in %s", filename)
             return None
             
         except Exception as e:
-            print(f"Errore nella ricerca della pagina: {e}")
+            logger.error("Errore nella ricerca della pagina: %s", e)
             return None
 
     def _extract_table_data(self, page, filename: str, is_pre_2019: bool) -> Optional[pd.DataFrame]:
@@ -163,7 +313,7 @@ class AccommodationExtractor(BaseExtractor):
             return None
             
         except Exception as e:
-            print(f"Errore nell'estrazione della tabella: {e}")
+            logger.error("Errore nell'estrazione della tabella: %s", e)
             return None
 
     def _extract_with_table_settings(self, page, filename: str, is_pre_2019: bool) -> Optional[pd.DataFrame]:
@@ -188,10 +338,11 @@ class AccommodationExtractor(BaseExtractor):
             # Processa ogni tabella trovata
             for table in tables:
                 if table and len(table) >= 3:  # Almeno 3 righe
-                    if is_pre_2019:
-                        df = self._process_pre_2019_table_structure(table, filename)
-                    else:
-                        df = self._process_post_2019_table_structure(table, filename)
+                    # Filtro rapido sulla prima colonna: senza etichette di regione la pulizia completa è inutile
+                    if not any(row and row[0] and _is_region_label(' '.join(str(row[0]).split()).lower(), is_pre_2019)
+                               for row in table):
+                        continue
+                    df = self._process_table_structure(table, filename, is_pre_2019)
                     
                     if not df.empty:
                         return df
@@ -199,7 +350,7 @@ class AccommodationExtractor(BaseExtractor):
             return None
             
         except Exception as e:
-            print(f"Errore nell'estrazione con impostazioni: {e}")
+            logger.error("Errore nell'estrazione con impostazioni: %s", e)
             return None
 
     def _extract_with_text_analysis(self, page, filename: str, is_pre_2019: bool) -> Optional[pd.DataFrame]:
@@ -228,30 +379,16 @@ class AccommodationExtractor(BaseExtractor):
                 if line and not any(keyword in line.upper() for keyword in ['NOTE', 'FONTE', 'ELABORAZIONE']):
                     table_lines.append(line)
             
-            if is_pre_2019:
-                df = self._process_pre_2019_text_lines(table_lines, filename)
-            else:
-                df = self._process_post_2019_text_lines(table_lines, filename)
-            
-            return df
+            return self._process_text_lines(table_lines, filename, is_pre_2019)
             
         except Exception as e:
-            print(f"Errore nell'estrazione con analisi testo: {e}")
+            logger.error("Errore nell'estrazione con analisi testo: %s", e)
             return None
 
-    def _process_pre_2019_table_structure(self, table_data: List[List[str]], filename: str) -> pd.DataFrame:
-        """Processa la struttura della tabella pre-2019 (3 colonne)"""
+    def _process_table_structure(self, table_data: List[List[str]], filename: str, is_pre_2019: bool) -> pd.DataFrame:
+        """Processa la struttura della tabella (pre-2019: 3 colonne, post-2019: 5 colonne)"""
+        formato = 'pre-2019' if is_pre_2019 else 'post-2019'
         try:
-            # Lista delle regioni italiane per validazione
-            regioni_italiane = {
-                'abruzzo', 'basilicata', 'calabria', 'campania', 'emilia-romagna',
-                'friuli-venezia giulia', 'lazio', 'liguria', 'lombardia', 'marche',
-                'molise', 'piemonte', 'puglia', 'sardegna', 'sicilia', 'toscana',
-                'trentino-alto adige', 'umbria', "valle d'aosta", 'veneto',
-                'trentino alto adige', 'friuli venezia giulia', 'valle d aosta',
-                'emilia romagna', 'trentino-alto adige/südtirol'
-            }
-            
             # Pulisce i dati della tabella
             cleaned_data = []
             for row in table_data:
@@ -263,8 +400,8 @@ class AccommodationExtractor(BaseExtractor):
                     if cell is None:
                         clean_cell = ""
                     else:
-                        # Rimuove spazi multipli e newline
-                        clean_cell = re.sub(r'\s+', ' ', str(cell).strip())
+                        # Rimuove spazi multipli e newline (split/join, senza regex)
+                        clean_cell = ' '.join(str(cell).split())
                     clean_row.append(clean_cell)
                 
                 # Aggiunge solo righe non vuote
@@ -278,7 +415,7 @@ class AccommodationExtractor(BaseExtractor):
             region_rows = []
             
             for row in cleaned_data:
-                # Per formato pre-2019, almeno 2 colonne (Regione e Totale)
+                # Una riga valida deve avere almeno 2 colonne (Regione e Totale per il pre-2019)
                 if len(row) < 2:
                     continue
                 
@@ -286,338 +423,103 @@ class AccommodationExtractor(BaseExtractor):
                 if not regione:
                     continue
                 
-                regione_lower = regione.lower()
-                
-                # Salta righe che contengono il titolo, totali o vuote
-                skip_patterns = [
-                    "presenze migranti", "presenza migranti", "totale", 
-                    "aggiornamento", "regione", "note", "fonte", "percentuale"
-                ]
-                
-                if any(pattern in regione_lower for pattern in skip_patterns):
-                    continue
-                
-                # Verifica che sia una regione italiana valida
-                regione_normalized = regione_lower.replace('-', ' ').replace("'", "").replace("'", "").replace(".", "").replace("/", " ").replace("Ã¼", "u").replace("ü", "u")
-                regione_words = regione_normalized.split()
-                
-                # Controlla se almeno una parola della regione corrisponde
-                is_regione = any(word in regioni_italiane for word in regione_words if len(word) > 3)
-                is_regione_full = regione_normalized in regioni_italiane
-                
-                # Lista di keyword per identificare le regioni
-                strong_keywords = ['lombardia', 'lazio', 'campania', 'sicilia', 'veneto', 'piemonte', 
-                                 'toscana', 'puglia', 'emilia', 'sardegna', 'calabria', 'liguria',
-                                 'abruzzo', 'marche', 'umbria', 'molise', 'basilicata', 'trentino',
-                                 'alto adige', 'friuli', 'valle', 'aosta']
-                
-                has_strong_keyword = any(keyword in regione_lower for keyword in strong_keywords)
-                
-                if is_regione or is_regione_full or has_strong_keyword:
-                    # Prende la colonna del totale (seconda colonna)
-                    totale = row[1] if len(row) > 1 else "0"
-                    
-                    # Per formato pre-2019, prende solo il totale
-                    # Inserisce uno 0 per le altre colonne
-                    valid_row = [
-                        regione,           # regione
-                        "0",               # migranti_hot_spot
-                        "0",               # migranti_centri_accoglienza
-                        "0",               # migranti_siproimi_sai
-                        totale             # totale_accoglienza
-                    ]
+                # Salta titolo e totali; le etichette si ripetono in ogni PDF, quindi l'esito è memoizzato
+                if _is_region_label(regione.lower(), is_pre_2019):
+                    if is_pre_2019:
+                        # Per formato pre-2019 prende solo il totale (seconda colonna)
+                        # e inserisce uno 0 per le altre colonne
+                        valid_row = [regione, "0", "0", "0", row[1]]
+                    else:
+                        # Prende tutte le colonne disponibili (almeno 2, massimo 5)
+                        valid_row = [regione] + [str(cell) for cell in row[1:5]]
+                        
+                        # Se mancano le colonne, aggiunge 0
+                        valid_row += ["0"] * (5 - len(valid_row))
                     
                     region_rows.append(valid_row)
             
             if not region_rows:
-                print(f"  Nessuna regione trovata in {filename}")
+                logger.debug("Nessuna regione trovata in %s", filename)
                 return pd.DataFrame()
             
             # Crea DataFrame con nuovi nomi colonne
-            df = pd.DataFrame(region_rows, columns=[
-                'regione', 
-                'migranti_hot_spot',
-                'migranti_centri_accoglienza',
-                'migranti_siproimi_sai',
-                'totale_accoglienza'
-            ])
+            df = pd.DataFrame(region_rows, columns=_TABLE_COLUMNS)
             
             # Pulisce e converte i numeri
-            numeric_columns = ['migranti_hot_spot', 'migranti_centri_accoglienza', 
-                             'migranti_siproimi_sai', 'totale_accoglienza']
-            
-            for col in numeric_columns:
-                df[col] = (
-                    df[col]
-                    .astype(str)
-                    .str.replace(r'[^\d]', '', regex=True)
-                )
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                df[col] = df[col].fillna(0).astype(int)
+            df = self._convert_numeric_columns(df)
             
             # Normalizza i nomi delle regioni
             df = self._normalize_region_names(df)
             
-            print(f"  Trovate {len(df)} regioni (formato pre-2019)")
+            logger.debug("Trovate %d regioni (formato %s)", len(df), formato)
             return df
             
         except Exception as e:
-            print(f"Errore nel processing della struttura tabellare pre-2019: {e}")
+            logger.error("Errore nel processing della struttura tabellare %s: %s", formato, e)
             return pd.DataFrame()
 
-    def _process_pre_2019_text_lines(self, lines: List[str], filename: str) -> pd.DataFrame:
-        """Processa linee di testo per formato pre-2019"""
+    def _process_text_lines(self, lines: List[str], filename: str, is_pre_2019: bool) -> pd.DataFrame:
+        """Processa linee di testo (pre-2019: "Regione Totale Percentuale%", post-2019: "Regione HotSpot Centri SAI Totale")"""
+        formato = 'pre-2019' if is_pre_2019 else 'post-2019'
         try:
-            region_rows = []
-            
-            for line in lines:
-                # Pattern per formato pre-2019: "Regione Totale Percentuale%"
-                pattern = r'^([A-Za-z\s\-\']+?)\s+(\d{1,3}(?:\.\d{3})*)\s*(\d+,\d+)?%?\s*$'
-                match = re.match(pattern, line.strip())
-                
-                if match:
-                    regione = match.group(1).strip()
-                    totale = match.group(2).replace('.', '')
-                    
-                    # Salta intestazioni e totali
-                    if any(word in regione.lower() for word in ['presenz', 'regione', 'totale', 'aggiornamento']):
-                        continue
-                    
-                    # Aggiungi la riga
-                    region_rows.append([regione, "0", "0", "0", totale])
-            
-            if not region_rows:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(region_rows, columns=[
-                'regione', 
-                'migranti_hot_spot',
-                'migranti_centri_accoglienza',
-                'migranti_siproimi_sai',
-                'totale_accoglienza'
-            ])
+            line_re = _PRE_2019_LINE_RE if is_pre_2019 else _POST_2019_LINE_RE
+            # Intestazioni e totali da saltare
+            skip_words = _TEXT_SKIP_PRE_2019 if is_pre_2019 else _TEXT_SKIP_POST_2019
             
-            # Converti i numeri
-            numeric_columns = ['migranti_hot_spot', 'migranti_centri_accoglienza', 
-                             'migranti_siproimi_sai', 'totale_accoglienza']
-            
-            for col in numeric_columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-            
-            df = self._normalize_region_names(df)
-            return df
-            
-        except Exception as e:
-            print(f"Errore nel processing testo pre-2019: {e}")
-            return pd.DataFrame()
-
-    def _process_post_2019_table_structure(self, table_data: List[List[str]], filename: str) -> pd.DataFrame:
-        """Processa la struttura della tabella post-2019 (5 colonne)"""
-        try:
-            # Lista delle regioni italiane per validazione
-            regioni_italiane = {
-                'abruzzo', 'basilicata', 'calabria', 'campania', 'emilia-romagna',
-                'friuli-venezia giulia', 'lazio', 'liguria', 'lombardia', 'marche',
-                'molise', 'piemonte', 'puglia', 'sardegna', 'sicilia', 'toscana',
-                'trentino-alto adige', 'umbria', "valle d'aosta", 'veneto',
-                'trentino alto adige', 'friuli venezia giulia', 'valle d aosta',
-                'emilia romagna', 'trentino-alto adige/südtirol'
-            }
-            
-            # Pulisce i dati della tabella
-            cleaned_data = []
-            for row in table_data:
-                if row is None:
-                    continue
-                    
-                clean_row = []
-                for cell in row:
-                    if cell is None:
-                        clean_cell = ""
-                    else:
-                        # Rimuove spazi multipli e newline
-                        clean_cell = re.sub(r'\s+', ' ', str(cell).strip())
-                    clean_row.append(clean_cell)
-                
-                # Aggiunge solo righe non vuote
-                if any(clean_row) and not all(cell == "" for cell in clean_row):
-                    cleaned_data.append(clean_row)
-            
-            if not cleaned_data:
-                return pd.DataFrame()
-            
-            # Cerca le righe che contengono i dati delle regioni
             region_rows = []
             
-            for row in cleaned_data:
-                # Una riga valida deve avere almeno 2 colonne
-                if len(row) < 2:
-                    continue
-                
-                regione = row[0].strip()
-                if not regione:
+            for line in lines:
+                match = line_re.match(line.strip())
+                if not match:
                     continue
                 
-                regione_lower = regione.lower()
-                
-                # Salta righe che contengono il titolo, totali o vuote
-                skip_patterns = [
-                    "presenze migranti", "presenza migranti", "totale", 
-                    "aggiornamento", "regione", "note", "fonte"
-                ]
-                
-                if any(pattern in regione_lower for pattern in skip_patterns):
+                regione = match.group(1).strip()
+                if any(word in regione.lower() for word in skip_words):
                     continue
                 
-                # Verifica che sia una regione italiana valida
-                regione_normalized = regione_lower.replace('-', ' ').replace("'", "").replace("'", "").replace(".", "").replace("/", " ").replace("Ã¼", "u").replace("ü", "u")
-                regione_words = regione_normalized.split()
-                
-                # Controlla se almeno una parola della regione corrisponde
-                is_regione = any(word in regioni_italiane for word in regione_words if len(word) > 3)
-                is_regione_full = regione_normalized in regioni_italiane
-                
-                # Lista di keyword per identificare regioni
-                strong_keywords = ['lombardia', 'lazio', 'campania', 'sicilia', 'veneto', 'piemonte', 
-                                 'toscana', 'puglia', 'emilia', 'sardegna', 'calabria', 'liguria',
-                                 'abruzzo', 'marche', 'umbria', 'molise', 'basilicata', 'trentino',
-                                 'alto adige', 'friuli', 'valle', 'aosta']
-                
-                has_strong_keyword = any(keyword in regione_lower for keyword in strong_keywords)
-                
-                if is_regione or is_regione_full or has_strong_keyword:
-                    # Prende tutte le colonne disponibili (almeno 2, massimo 5)
-                    valid_row = [regione]  # Prima colonna: regione
-                    
-                    # Aggiunge le colonne numeriche (da 1 a 4)
-                    for j in range(1, min(5, len(row))):
-                        cell_value = str(row[j])
-                        valid_row.append(cell_value)
-                    
-                    # Se mancano le colonne, aggiunge 0
-                    while len(valid_row) < 5:
-                        valid_row.append("0")
-                    
-                    region_rows.append(valid_row)
+                if is_pre_2019:
+                    # Solo il totale, 0 per le altre colonne
+                    region_rows.append([regione, "0", "0", "0", match.group(2).replace('.', '')])
+                else:
+                    region_rows.append([
+                        regione,
+                        match.group(2) or "0",
+                        match.group(3).replace('.', ''),
+                        match.group(4).replace('.', ''),
+                        match.group(5).replace('.', ''),
+                    ])
             
             if not region_rows:
-                print(f"  Nessuna regione trovata in {filename}")
                 return pd.DataFrame()
             
-            # Crea DataFrame con nuovi nomi colonne
-            df = pd.DataFrame(region_rows, columns=[
-                'regione', 
-                'migranti_hot_spot',
-                'migranti_centri_accoglienza',
-                'migranti_siproimi_sai',
-                'totale_accoglienza'
-            ])
+            df = pd.DataFrame(region_rows, columns=_TABLE_COLUMNS)
             
-            # Pulisce e converte i numeri
-            numeric_columns = ['migranti_hot_spot', 'migranti_centri_accoglienza', 
-                             'migranti_siproimi_sai', 'totale_accoglienza']
-            
-            for col in numeric_columns:
-                df[col] = (
-                    df[col]
-                    .astype(str)
-                    .str.replace(r'[^\d]', '', regex=True)
-                )
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                df[col] = df[col].fillna(0).astype(int)
+            # I gruppi delle regex contengono solo cifre: conversione diretta, senza pulizia
+            df = df.astype(dict.fromkeys(_NUMERIC_COLUMNS, 'int32'))
             
-            # Normalizza i nomi delle regioni
             df = self._normalize_region_names(df)
-            
-            print(f"  Trovate {len(df)} regioni (formato post-2019)")
             return df
             
         except Exception as e:
-            print(f"Errore nel processing della struttura tabellare post-2019: {e}")
+            logger.error("Errore nel processing testo %s: %s", formato, e)
             return pd.DataFrame()
 
-    def _process_post_2019_text_lines(self, lines: List[str], filename: str) -> pd.DataFrame:
-        """Processa linee di testo per formato post-2019"""
-        try:
-            region_rows = []
-            
-            for line in lines:
-                # Pattern per formato post-2019: "Regione HotSpot Centri SAI Totale"
-                pattern = r'^([A-Za-z\s\-\']+?)\s+(\d*)\s+(\d{1,3}(?:\.\d{3})*)\s+(\d{1,3}(?:\.\d{3})*)\s+(\d{1,3}(?:\.\d{3})*)\s*$'
-                match = re.match(pattern, line.strip())
-                
-                if match:
-                    regione = match.group(1).strip()
-                    hot_spot = match.group(2) or "0"
-                    centri = match.group(3).replace('.', '')
-                    sai = match.group(4).replace('.', '')
-                    totale = match.group(5).replace('.', '')
-                    
-                    # Salta intestazioni
-                    if any(word in regione.lower() for word in ['presenz', 'regione', 'hot', 'centri']):
-                        continue
-                    
-                    region_rows.append([regione, hot_spot, centri, sai, totale])
-            
-            if not region_rows:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(region_rows, columns=[
-                'regione', 
-                'migranti_hot_spot',
-                'migranti_centri_accoglienza',
-                'migranti_siproimi_sai',
-                'totale_accoglienza'
-            ])
-            
-            # Converti i numeri
-            numeric_columns = ['migranti_hot_spot', 'migranti_centri_accoglienza', 
-                             'migranti_siproimi_sai', 'totale_accoglienza']
-            
-            for col in numeric_columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-            
-            df = self._normalize_region_names(df)
-            return df
-            
-        except Exception as e:
-            print(f"Errore nel processing testo post-2019: {e}")
-            return pd.DataFrame()
+    def _convert_numeric_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Converte in interi le colonne numeriche con un'unica passata su tutte le celle"""
+        # Le 4 colonne vengono appiattite in una sola Series: una pulizia e una conversione per tabella
+        valori = pd.Series(df[_NUMERIC_COLUMNS].to_numpy().ravel()).astype(str)
+        valori = valori.str.replace(_NON_DIGIT_RE, '', regex=True)
+        # int32 basta per i conteggi (anche i totali nazionali): metà memoria rispetto a int64
+        numeri = pd.to_numeric(valori, errors='coerce').fillna(0).astype('int32')
+        matrice = numeri.to_numpy().reshape(len(df), len(_NUMERIC_COLUMNS))
+        for i, col in enumerate(_NUMERIC_COLUMNS):
+            df[col] = matrice[:, i]
+        return df
 
     def _normalize_region_names(self, df: pd.DataFrame) -> pd.DataFrame:
         """Normalizza i nomi delle regioni"""
-        mapping = {
-            'TRENTINO-ALTO ADIGE/SÃ¼DTIROL': 'Trentino-Alto Adige',
-            'TRENTINO-ALTO ADIGE/SÜDTIROL': 'Trentino-Alto Adige', 
-            'TRENTINO-ALTO ADIGE/SUDTIROL': 'Trentino-Alto Adige',
-            'TRENTINO-ALTO ADIGE': 'Trentino-Alto Adige',
-            'TRENTINO ALTO ADIGE': 'Trentino-Alto Adige',
-            'TRENTINO': 'Trentino-Alto Adige',
-            'ALTO ADIGE': 'Trentino-Alto Adige',
-            
-            'VALLE D\'AOSTA': 'Valle D\'Aosta',
-            'VALLE D\'AOSTA/VALLÃ©E D\'AOSTE': 'Valle D\'Aosta',
-            'VALLE D\'AOSTA/VALLÉE D\'AOSTE': 'Valle D\'Aosta',
-            'VALLE D AOSTA/VALLEE D AOSTE': 'Valle D\'Aosta',
-            'VALLE D AOSTA': 'Valle D\'Aosta',
-            'VALLE DAOSTA': 'Valle D\'Aosta',
-            'VALLE D\'AOSTA': 'Valle D\'Aosta',
-            'VALLE D\'AOSTA/VALLEE D\'AOSTE': 'Valle D\'Aosta',
-            
-            'FRIULI-VENEZIA GIULIA': 'Friuli-Venezia Giulia',
-            'FRIULI VENEZIA GIULIA': 'Friuli-Venezia Giulia',
-            'FRIULI': 'Friuli-Venezia Giulia',
-            
-            'EMILIA-ROMAGNA': 'Emilia-Romagna',
-            'EMILIA ROMAGNA': 'Emilia-Romagna',
-            
-            'PUGLIE': 'Puglia',
-            'TOSCANE': 'Toscana',
-            'LOMBARDIE': 'Lombardia'
-        }
-        
-        # Applica il mapping
-        df['regione'] = df['regione'].str.upper().replace(mapping).str.title()
+        # Un solo passaggio sulla colonna: maiuscolo, mapping e title-case in una lookup
+        df['regione'] = df['regione'].map(_normalize_region_name, na_action='ignore')
         
         return df
 
@@ -634,28 +536,33 @@ class AccommodationExtractor(BaseExtractor):
 
         return table_data
 
+    def prepare_output(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Ordina per data e filtra i dati dal 2017 in poi"""
+        return DataProcessor.sort_and_filter_by_date(
+            data, 
+            date_column='data_riferimento',
+            start_year=2017
+        )
+
     def save_to_csv(self, filename: str):
         """Salva i dati accumulati in CSV ordinato per data"""
         if not self.complete_data.empty:
-            # Ordina e filtra i dati dal 2017 in poi
-            sorted_data = DataProcessor.sort_and_filter_by_date(
-                self.complete_data, 
-                date_column='data_riferimento',
-                start_year=2017
-            )
+            sorted_data = self.prepare_output(self.complete_data)
+            
+            # Anno (date ISO: prime 4 cifre), calcolato una volta per il controllo 2025 e le statistiche
+            anni = sorted_data['data_riferimento'].str[:4] if 'data_riferimento' in sorted_data.columns else None
             
             # Assicurati che i dati includano il 2025
-            if 'data_riferimento' in sorted_data.columns:
+            if anni is not None:
                 # Cerca dati del 2025
-                data_2025 = sorted_data[sorted_data['data_riferimento'].str.startswith('2025')]
-                print(f"\nDati 2025 trovati: {len(data_2025)} righe")
+                mask_2025 = anni == '2025'
+                print(f"\nDati 2025 trovati: {int(mask_2025.sum())} righe")
                 
-                if len(data_2025) > 0:
-                    date_2025 = data_2025['data_riferimento'].unique()
+                if mask_2025.any():
+                    date_2025 = sorted_data.loc[mask_2025, 'data_riferimento'].unique()
                     print(f"Date 2025 presenti: {', '.join(sorted(date_2025))}")
             
-            csv_path = self.output_folder / filename
-            sorted_data.to_csv(csv_path, index=False)
+            csv_path = self._write_output(sorted_data, filename)
             
             print(f"\nDati accoglienza salvati in: {csv_path}")
             print(f"Righe totali: {len(sorted_data)}")
@@ -664,9 +571,8 @@ class AccommodationExtractor(BaseExtractor):
             print(f"File falliti: {len(self.failed_files)}")
             
             # Statistiche per anno
-            if 'data_riferimento' in sorted_data.columns:
-                sorted_data['anno'] = sorted_data['data_riferimento'].str[:4]
-                stats = sorted_data['anno'].value_counts().sort_index()
+            if anni is not None:
+                stats = anni.value_counts(sort=False).sort_index()
                 print("\nRighe per anno:")
                 for anno, count in stats.items():
                     print(f"  {anno}: {count} righe")
@@ -679,21 +585,14 @@ class AccommodationExtractor(BaseExtractor):
                     print(f"  {formato}: {count} righe")
             
             # Statistiche per regione
-            regione_stats = sorted_data['regione'].value_counts()
+            regione_stats = sorted_data['regione'].value_counts(sort=False).sort_index()
             print(f"\nRegioni trovate: {len(regione_stats)}")
             print("Tutte le regioni:")
-            for regione, count in regione_stats.sort_index().items():
+            for regione, count in regione_stats.items():
                 print(f"  {regione}: {count} righe")
                 
             # Cerca regioni mancanti
-            tutte_regioni = [
-                'Abruzzo', 'Basilicata', 'Calabria', 'Campania', 'Emilia-Romagna',
-                'Friuli-Venezia Giulia', 'Lazio', 'Liguria', 'Lombardia', 'Marche',
-                'Molise', 'Piemonte', 'Puglia', 'Sardegna', 'Sicilia', 'Toscana',
-                'Trentino-Alto Adige', 'Umbria', 'Valle D\'Aosta', 'Veneto'
-            ]
-            
-            regioni_mancanti = set(tutte_regioni) - set(regione_stats.index)
+            regioni_mancanti = _TUTTE_REGIONI.difference(regione_stats.index)
             if regioni_mancanti:
                 print(f"\nRegioni mancanti: {', '.join(regioni_mancanti)}")
             else:
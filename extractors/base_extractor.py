@@ -1,9 +1,25 @@
 # base_extractor.py
 import pandas as pd
 import os
+import sys
+import hashlib
+import inspect
+import logging
 from abc import ABC, abstractmethod
 from typing import Optional, Dict, Any
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    # PyMuPDF (opzionale): lettura rapida del testo per scartare le pagine non pertinenti
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+from utils import file_utils
+
+# Messaggi emessi anche dai processi worker (cache, lettura rapida); il riepilogo resta su stdout
+logger = logging.getLogger(__name__)
 
 class BaseExtractor(ABC):
     """Classe base per tutti gli estrattori"""
@@ -12,8 +28,10 @@ class BaseExtractor(ABC):
         self.pdf_folder = Path(pdf_folder)
         self.output_folder = Path(output_folder)
         self.complete_data = pd.DataFrame()
+        self._parts = []
         self.processed_files = []
         self.failed_files = []
+        self._fingerprint = None
         
         # Crea directory output
         self.output_folder.mkdir(parents=True, exist_ok=True)
@@ -23,10 +41,10 @@ class BaseExtractor(ABC):
         """Estrae dati da un singolo PDF - da implementare nelle sottoclassi"""
         pass
     
-    def process_all_pdfs(self, max_files: Optional[int] = None) -> pd.DataFrame:
-        """Processa tutti i PDF nella cartella"""
-        pdf_files = [f for f in self.pdf_folder.glob("*.pdf")]
-        pdf_files.sort()
+    def process_all_pdfs(self, max_files: Optional[int] = None, max_workers: Optional[int] = None,
+                         use_cache: bool = True) -> pd.DataFrame:
+        """Processa tutti i PDF nella cartella (in parallelo su più processi se max_workers > 1)"""
+        pdf_files = self._list_pdf_files()
         
         if not pdf_files:
             print("Nessun PDF trovato")
@@ -37,40 +55,156 @@ class BaseExtractor(ABC):
         
         print(f"Processando {len(pdf_files)} file PDF")
         
-        for i, pdf_file in enumerate(pdf_files, 1):
-            print(f"\n[{i}/{len(pdf_files)}] {pdf_file.name}")
-            
-            try:
-                result = self.extract_from_single_pdf(pdf_file)
-                if result is not None and not result.empty:
-                    self._accumulate_data(result, pdf_file.name)
-                    print(f"Estrazione riuscita: {len(result)} righe")
-                else:
+        # Con la cache attiva i PDF già elaborati dallo stesso codice non vengono riletti
+        extract = self._extract_with_cache if use_cache else self.extract_from_single_pdf
+        
+        executor = None
+        futures = None
+        if max_workers and max_workers > 1:
+            # Il parsing dei PDF è CPU-bound: un processo per file, risultati raccolti in ordine
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+            futures = [executor.submit(extract, pdf_file) for pdf_file in pdf_files]
+        
+        try:
+            for i, pdf_file in enumerate(pdf_files, 1):
+                print(f"\n[{i}/{len(pdf_files)}] {pdf_file.name}")
+                
+                try:
+                    if futures is not None:
+                        result = futures[i - 1].result()
+                    else:
+                        result = extract(pdf_file)
+                    if result is not None and not result.empty:
+                        self._accumulate_data(result, pdf_file.name)
+                        print(f"Estrazione riuscita: {len(result)} righe")
+                    else:
+                        self.failed_files.append(pdf_file.name)
+                        print("Nessun dato estratto")
+                        
+                except Exception as e:
                     self.failed_files.append(pdf_file.name)
-                    print("Nessun dato estratto")
-                    
-            except Exception as e:
-                self.failed_files.append(pdf_file.name)
-                print(f"Errore durante l'estrazione: {e}")
-            
-            self.processed_files.append(pdf_file.name)
+                    print(f"Errore durante l'estrazione: {e}")
+                
+                self.processed_files.append(pdf_file.name)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        # Un solo concat finale invece di uno per file (costo lineare nel numero di righe)
+        if self._parts:
+            # Il DataFrame vuoto iniziale non entra nel concat: i tipi restano quelli dei singoli file
+            parts = self._parts if self.complete_data.empty else [self.complete_data, *self._parts]
+            self.complete_data = pd.concat(parts, ignore_index=True)
+            self._parts = []
         
         self._generate_report()
         return self.complete_data
     
+    def _list_pdf_files(self) -> list:
+        """PDF della cartella in ordine di nome (scandir: tipo del file senza una stat per voce)"""
+        try:
+            with os.scandir(self.pdf_folder) as entries:
+                names = [entry.name for entry in entries
+                         if entry.name.endswith('.pdf') and entry.is_file()]
+        except FileNotFoundError:
+            return []
+        return [self.pdf_folder / name for name in sorted(names)]
+    
+    def _extract_with_cache(self, pdf_path: Path) -> Optional[pd.DataFrame]:
+        """Estrae i dati dal PDF riusando il risultato salvato se PDF ed estrattore non sono cambiati"""
+        cache_path = self._cache_path(pdf_path)
+        if cache_path is not None and cache_path.exists():
+            try:
+                return pd.read_parquet(cache_path)
+            except Exception as e:
+                logger.warning("Cache non leggibile per %s, nuova estrazione: %s", pdf_path.name, e)
+        
+        result = self.extract_from_single_pdf(pdf_path)
+        
+        # Salva solo le estrazioni riuscite; scrittura atomica per i processi paralleli
+        if cache_path is not None and result is not None and not result.empty:
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+                result.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, cache_path)
+            except Exception as e:
+                logger.warning("Impossibile salvare la cache per %s: %s", pdf_path.name, e)
+        
+        return result
+    
+    def _cache_path(self, pdf_path: Path) -> Optional[Path]:
+        """Percorso in cache: hash del nome e del contenuto del PDF e del codice dell'estrattore"""
+        try:
+            digest = hashlib.blake2b(self._code_fingerprint(), digest_size=16)
+            # Il nome entra nei dati (filename e data_riferimento): un PDF rinominato non riusa la cache
+            digest.update(pdf_path.name.encode('utf-8'))
+            with open(pdf_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        return self.output_folder / '.cache' / type(self).__name__ / f"{digest.hexdigest()}.parquet"
+    
+    def _code_fingerprint(self) -> bytes:
+        """Hash dei sorgenti che determinano l'estrazione: una modifica al codice invalida la cache"""
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for module in (sys.modules[type(self).__module__], sys.modules[__name__], file_utils):
+                digest.update(Path(inspect.getsourcefile(module)).read_bytes())
+            self._fingerprint = digest.digest()
+        return self._fingerprint
+    
+    def _pages_containing(self, pdf_path: Path, needles) -> Optional[set]:
+        """Pagine il cui testo (maiuscolo, senza spazi) contiene almeno una delle stringhe; None senza PyMuPDF o senza corrispondenze"""
+        if pymupdf is None:
+            return None
+        try:
+            pages = set()
+            with pymupdf.open(pdf_path) as doc:
+                for page_num, page in enumerate(doc):
+                    # Senza spazi: PyMuPDF e pdfplumber spezzano le righe in modo diverso
+                    compact = ''.join(page.get_text().upper().split())
+                    if any(needle in compact for needle in needles):
+                        pages.add(page_num)
+            # Nessuna corrispondenza non esclude le pagine: il testo di PyMuPDF può differire da quello di pdfplumber
+            return pages or None
+        except Exception as e:
+            logger.warning("PyMuPDF non ha letto %s, scansione completa con pdfplumber: %s", pdf_path.name, e)
+            return None
+    
     def _accumulate_data(self, new_data: pd.DataFrame, filename: str):
-        """Accumula i nuovi dati nel dataset completo"""
-        if self.complete_data.empty:
-            self.complete_data = new_data
-        else:
-            self.complete_data = pd.concat([self.complete_data, new_data], ignore_index=True)
+        """Accumula i nuovi dati; il dataset completo viene composto a fine elaborazione"""
+        self._parts.append(new_data)
+    
+    def _write_output(self, data: pd.DataFrame, filename: str) -> Path:
+        """Scrive il CSV e, dallo stesso DataFrame in memoria, il Parquet omonimo"""
+        csv_path = self.output_folder / filename
+        data.to_csv(csv_path, index=False)
+        
+        # Scritto dopo il CSV: risulta aggiornato e la conversione successiva lo salta
+        try:
+            # ZSTD: file più piccoli di Snappy a parità di velocità di lettura; i Parquet Snappy esistenti restano leggibili
+            data.to_parquet(csv_path.with_suffix('.parquet'), compression='zstd', compression_level=3, index=False)
+        except Exception as e:
+            print(f"Impossibile scrivere il Parquet per {filename}: {e}")
+        return csv_path
+    
+    def prepare_output(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Forma finale del dataset da salvare (ordinamento, filtri, tipi); le sottoclassi la ridefiniscono"""
+        return data
+    
+    def save_dataset(self, data: pd.DataFrame, filename: str) -> pd.DataFrame:
+        """Salva un dataset nella stessa forma di save_to_csv e restituisce i dati scritti"""
+        output_data = self.prepare_output(data)
+        self._write_output(output_data, filename)
+        return output_data
     
     def save_to_csv(self, filename: str):
         """Salva i dati in CSV"""
         if not self.complete_data.empty:
-            csv_path = self.output_folder / filename
-            self.complete_data.to_csv(csv_path, index=False)
-            print(f"Dati salvati in: {csv_path}")
+            self.save_dataset(self.complete_data, filename)
+            print(f"Dati salvati in: {self.output_folder / filename}")
         else:
             print("Nessun dato da salvare")
     
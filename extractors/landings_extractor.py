@@ -5,11 +5,40 @@ from pathlib import Path
 from typing import Optional, Dict, List, Tuple
 import re
 import calendar
+import functools
+import logging
 from datetime import datetime
 
 from extractors.base_extractor import BaseExtractor
 from utils.file_utils import DateExtractor, DataProcessor
 
+# Messaggi per singolo PDF: DEBUG per l'avanzamento, ERROR per i fallimenti
+logger = logging.getLogger(__name__)
+
+# Espressioni regolari compilate una volta al caricamento del modulo
+# Titolo completo del grafico
+_TITLE_RE = re.compile(r'Migranti sbarcati per giorno al \d{1,2} \w+ \d{4}\* - mese di \w+')
+# Le due righe sotto il grafico
+_FIRST_MARKER_RE = re.compile(r'\*I dati si riferiscono agli eventi di sbarco rilevati entro le ore 8:00 del giorno di riferimento')
+_SOURCE_MARKER_RE = re.compile(r'Fonte: Dipartimento della Pubblica sicurezza\. I dati sono suscettibili di successivo consolidamento\.')
+# Inizio del titolo in maiuscolo e senza spazi, per il filtro rapido delle pagine
+_TITLE_NEEDLE = 'MIGRANTISBARCATIPERGIORNO'
+
+# Righe di rumore nell'area del grafico (note, altre tabelle, totali)
+_NOISE_RE = re.compile(r'Note:|Tabella|PRESENZE|NAZIONALITÀ|Totale', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=None)
+def _month_patterns(abbr_mese: str) -> Tuple[re.Pattern, Tuple[re.Pattern, ...]]:
+    """Pattern principale e alternativi per "giorno-mese valore", compilati una volta per mese"""
+    main_pattern = re.compile(r'(\d{1,2})-' + abbr_mese + r'\s+(\d{1,6})', re.IGNORECASE)
+    alternative_patterns = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+        r'(\d{1,2})\s+' + abbr_mese + r'\s+(\d{1,6})',
+        r'(\d{1,2})[' + abbr_mese + r']\s*(\d{1,6})',
+        r'(\d{1,2})\s+(\d{1,6})',
+    ))
+    return main_pattern, alternative_patterns
+
 
 class LandingsExtractor(BaseExtractor):
     """Estrattore per i dati degli sbarchi giornalieri dal grafico"""
@@ -28,12 +57,12 @@ class LandingsExtractor(BaseExtractor):
     def extract_from_single_pdf(self, pdf_path: Path) -> Optional[pd.DataFrame]:
         """Estrae i dati degli sbarchi giornalieri da un singolo PDF"""
         try:
-            print(f"Elaborando: {pdf_path.name}")
+            logger.debug("Elaborando: %s", pdf_path.name)
             
             # Estrae la data di riferimento dal filename
             date_str = DateExtractor.extract_date_from_filename(pdf_path.name)
             if date_str == "Data_non_riconosciuta":
-                print(f"  Data non riconosciuta per {pdf_path.name}")
+                logger.info("Data non riconosciuta per %s", pdf_path.name)
                 return None
 
             reference_date = datetime.strptime(date_str, '%Y-%m-%d')
@@ -45,31 +74,28 @@ class LandingsExtractor(BaseExtractor):
             
             if result and result['data']:
                 # Crea il DataFrame con i dati trovati
-                data = []
-                for giorno, migranti_sbarcati in result['data'].items():
-                    data.append({
-                        'giorno': giorno,
-                        'migranti_sbarcati': migranti_sbarcati
-                    })
-                
-                df = pd.DataFrame(data)
+                # Tipi compatti: giorno 1-31 in int8, sbarchi (validati <= 10000) in int32 come gli altri conteggi
+                df = pd.DataFrame({
+                    'giorno': pd.array(list(result['data'].keys()), dtype='int8'),
+                    'migranti_sbarcati': pd.array(list(result['data'].values()), dtype='int32'),
+                })
                 
                 # Aggiunge i metadati
                 df['data_riferimento'] = date_str
                 df['filename'] = pdf_path.name
                 
-                print(f"  Estrazione riuscita: {len(df)} giorni con dati su {result['expected_days']} totali")
+                logger.debug("Estrazione riuscita: %d giorni con dati su %d totali", len(df), result['expected_days'])
                 
                 if result['missing_days']:
-                    print(f"  Giorni con 0 sbarchi: {len(result['missing_days'])}")
+                    logger.debug("Giorni con 0 sbarchi: %d", len(result['missing_days']))
                 
                 return df
             else:
-                print(f"  Nessun dato estratto da {pdf_path.name}")
+                logger.info("Nessun dato estratto da %s", pdf_path.name)
                 return None
                     
         except Exception as e:
-            print(f"Errore nell'elaborazione di {pdf_path.name}: {e}")
+            logger.error("Errore nell'elaborazione di %s: %s", pdf_path.name, e)
             return None
 
     def _extract_using_visual_structure(self, pdf_path: Path, mese: int, anno: int) -> Optional[Dict]:
@@ -78,8 +104,16 @@ class LandingsExtractor(BaseExtractor):
             abbr_mese = self.mesi_abbr.get(mese, '')
             _, num_giorni_mese = calendar.monthrange(anno, mese)
 
+            # Lettura rapida con PyMuPDF (se installato): solo le pagine con il titolo del grafico
+            candidates = self._pages_containing(pdf_path, (_TITLE_NEEDLE,))
+            
             with pdfplumber.open(pdf_path) as pdf:
-                for page_num in range(len(pdf.pages)):
+                page_order = range(len(pdf.pages))
+                if candidates is not None:
+                    # Prima le pagine indicate da PyMuPDF, poi le altre se lì il grafico non viene trovato
+                    page_order = sorted(page_order, key=lambda num: num not in candidates)
+                
+                for page_num in page_order:
                     page = pdf.pages[page_num]
                     full_text = page.extract_text()
                     
@@ -87,23 +121,24 @@ class LandingsExtractor(BaseExtractor):
                         continue
 
                     # Verifica se questa è la pagina con il grafico usando i marcatori unici
-                    if not self._has_unique_chart_markers(full_text):
+                    title_match = self._match_chart_title(full_text)
+                    if title_match is None:
                         continue
 
-                    print(f"  Trovato grafico a pagina {page_num + 1}")
+                    logger.debug("Trovato grafico a pagina %d", page_num + 1)
 
                     # Estrae solo l'area tra il titolo e le due righe uniche sotto il grafico
-                    chart_area_text = self._extract_chart_area_using_unique_markers(full_text)
+                    chart_area_text = self._extract_chart_area_using_unique_markers(full_text, title_match)
                     
                     if not chart_area_text:
-                        print("  Impossibile isolare l'area del grafico")
+                        logger.debug("Impossibile isolare l'area del grafico")
                         continue
 
                     # Estrae i dati solo dall'area del grafico isolata
                     chart_data = self._extract_data_from_chart_area(chart_area_text, abbr_mese, num_giorni_mese)
                     
                     if chart_data and self._validate_visual_structure(chart_data, num_giorni_mese):
-                        print(f"  Trovati {len(chart_data)} giorni validi nella struttura visiva")
+                        logger.debug("Trovati %d giorni validi nella struttura visiva", len(chart_data))
                         
                         missing_days = [day for day in range(1, num_giorni_mese + 1) if day not in chart_data]
 
@@ -114,58 +149,47 @@ class LandingsExtractor(BaseExtractor):
                             'expected_days': num_giorni_mese
                         }
                     else:
-                        print("  Dati non validi")
+                        logger.debug("Dati non validi")
                 
                 return None
             
         except Exception as e:
-            print(f"Errore nell'estrazione con struttura visiva: {e}")
+            logger.error("Errore nell'estrazione con struttura visiva: %s", e)
             return None
 
-    def _has_unique_chart_markers(self, text: str) -> bool:
+    def _match_chart_title(self, text: str) -> Optional[re.Match]:
         """
         Verifica se il testo contiene i marcatori unici del grafico visivo
+        e restituisce il match del titolo, riusato per isolare l'area del grafico
         """
         # 1. Titolo completo con formato specifico
-        title_pattern = r'Migranti sbarcati per giorno al \d{1,2} \w+ \d{4}\* - mese di \w+'
-        has_title = re.search(title_pattern, text) is not None
+        title_match = _TITLE_RE.search(text)
+        if title_match is None:
+            return None
         
         # 2. Le due righe sotto il grafico
-        unique_markers = [
-            r'\*I dati si riferiscono agli eventi di sbarco rilevati entro le ore 8:00 del giorno di riferimento',
-            r'Fonte: Dipartimento della Pubblica sicurezza\. I dati sono suscettibili di successivo consolidamento\.'
-        ]
-        
-        has_unique_markers = all(
-            re.search(marker, text) for marker in unique_markers
-        )
+        if _FIRST_MARKER_RE.search(text) is None or _SOURCE_MARKER_RE.search(text) is None:
+            return None
         
-        return has_title and has_unique_markers
+        return title_match
 
-    def _extract_chart_area_using_unique_markers(self, full_text: str) -> Optional[str]:
+    def _extract_chart_area_using_unique_markers(self, full_text: str, title_match: re.Match) -> Optional[str]:
         """
         Isola l'area del grafico usando i marcatori unici:
-        - Inizio: dopo il titolo completo
+        - Inizio: dopo il titolo completo (match già trovato sulla pagina)
         - Fine: prima della prima riga unica sotto il grafico
         """
         try:
-            # Trova il titolo completo
-            title_pattern = r'Migranti sbarcati per giorno al \d{1,2} \w+ \d{4}\* - mese di \w+'
-            title_match = re.search(title_pattern, full_text)
-            if not title_match:
-                return None
-            
             title_end = title_match.end()
             
             # Trova la prima occorrenza della prima riga unica sotto il grafico
-            first_unique_line = r'\*I dati si riferiscono agli eventi di sbarco rilevati entro le ore 8:00 del giorno di riferimento'
-            first_line_match = re.search(first_unique_line, full_text[title_end:])
+            first_line_match = _FIRST_MARKER_RE.search(full_text, title_end)
             
             if not first_line_match:
                 return None
             
             # Estrae il testo tra il titolo e la prima riga unica
-            chart_area = full_text[title_end:title_end + first_line_match.start()].strip()
+            chart_area = full_text[title_end:first_line_match.start()].strip()
             
             # Rimuove eventuali altri elementi
             chart_area = self._clean_chart_area(chart_area)
@@ -173,45 +197,27 @@ class LandingsExtractor(BaseExtractor):
             return chart_area
             
         except Exception as e:
-            print(f"  Errore nell'estrazione area grafico: {e}")
+            logger.error("Errore nell'estrazione area grafico: %s", e)
             return None
 
     def _clean_chart_area(self, chart_area: str) -> str:
         """Pulisce l'area del grafico rimuovendo eventuali altri elementi"""
-        noise_patterns = [
-            r'Note:.*',
-            r'NOTE:.*',
-            r'Tabella.*',
-            r'PRESENZE.*',
-            r'NAZIONALITÀ.*',
-            r'Nazionalità.*',
-            r'Totale.*'
-        ]
-        
-        cleaned_lines = []
-        for line in chart_area.split('\n'):
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Controlla se la linea contiene pattern di rumore
-            is_noise = any(re.search(pattern, line, re.IGNORECASE) for pattern in noise_patterns)
-            if not is_noise:
-                cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines)
+        # Una sola scansione per riga con l'alternanza dei pattern di rumore
+        return '\n'.join(
+            line for line in map(str.strip, chart_area.split('\n'))
+            if line and not _NOISE_RE.search(line)
+        )
 
     def _extract_data_from_chart_area(self, chart_area: str, abbr_mese: str, num_giorni_mese: int) -> Dict[int, int]:
         """Estrae i dati dall'area pulita del grafico"""
         chart_data = {}
         
         # Pattern principale per i dati del grafico
-        pattern = r'(\d{1,2})-'+ abbr_mese + r'\s+(\d{1,6})'
-        matches = re.findall(pattern, chart_area, re.IGNORECASE)
+        main_pattern, _ = _month_patterns(abbr_mese)
         
-        for day, value in matches:
-            day_int = int(day)
-            value_int = int(value)
+        for match in main_pattern.finditer(chart_area):
+            day_int = int(match.group(1))
+            value_int = int(match.group(2))
             
             # Validazione base
             if 1 <= day_int <= num_giorni_mese and 0 <= value_int <= 10000:
@@ -227,21 +233,14 @@ class LandingsExtractor(BaseExtractor):
         """Pattern alternativi per l'estrazione dati"""
         chart_data = {}
         
-        patterns = [
-            r'(\d{1,2})\s+'+ abbr_mese + r'\s+(\d{1,6})',  
-            r'(\d{1,2})[' + abbr_mese + r']\s*(\d{1,6})',  
-            r'(\d{1,2})\s+(\d{1,6})',
-        ]
+        _, alternative_patterns = _month_patterns(abbr_mese)
         
-        for pattern in patterns:
-            matches = re.findall(pattern, chart_area, re.IGNORECASE)
-            for match in matches:
-                if len(match) == 2:
-                    day_int = int(match[0])
-                    value_int = int(match[1])
-                    if 1 <= day_int <= num_giorni_mese and 0 <= value_int <= 10000:
-                        if day_int not in chart_data:  # Evita sovrascritture
-                            chart_data[day_int] = value_int
+        for pattern in alternative_patterns:
+            for match in pattern.finditer(chart_area):
+                day_int = int(match.group(1))
+                value_int = int(match.group(2))
+                if 1 <= day_int <= num_giorni_mese and 0 <= value_int <= 10000:
+                    chart_data.setdefault(day_int, value_int)  # Evita sovrascritture
         
         return chart_data
 
@@ -251,64 +250,50 @@ class LandingsExtractor(BaseExtractor):
             if not chart_data:
                 return False
             
-            days = sorted(chart_data.keys())
-            values = list(chart_data.values())
+            num_days = len(chart_data)
             
             # 1. Controlla la presenza di almeno il 25% dei giorni
-            if len(days) < max(5, num_giorni_mese * 0.25):
-                print(f"    Troppi pochi giorni: {len(days)}/{num_giorni_mese}")
+            if num_days < max(5, num_giorni_mese * 0.25):
+                logger.debug("Troppi pochi giorni: %d/%d", num_days, num_giorni_mese)
                 return False
             
             # 2. Controlla i valori validi
-            if any(v < 0 for v in values):
-                return False
-            
-            if any(v > 10000 for v in values):
-                print(f"    Valori troppo alti: {max(values) if values else 0}")
-                return False
-            
-            # 3. Controlla la sequenza di giorni
-            if days != sorted(days):
+            values = chart_data.values()
+            if min(values) < 0:
                 return False
             
-            # 4. Controlla eventuali giorni duplicati
-            if len(days) != len(set(days)):
+            max_value = max(values)
+            if max_value > 10000:
+                logger.debug("Valori troppo alti: %d", max_value)
                 return False
             
-            # 5. Controlla la distribuzione giorni
-            day_range = max(days) - min(days) + 1
-            if day_range < len(days) * 0.8:  # I giorni dovrebbero coprire la maggior parte del mese
-                print(f"    Distribuzione giorni anomala: range {day_range}, giorni {len(days)}")
+            # 3. Controlla la distribuzione giorni
+            # (le chiavi del dizionario sono già uniche e non serve ordinarle per l'intervallo)
+            day_range = max(chart_data) - min(chart_data) + 1
+            if day_range < num_days * 0.8:  # I giorni dovrebbero coprire la maggior parte del mese
+                logger.debug("Distribuzione giorni anomala: range %d, giorni %d", day_range, num_days)
                 return False
             
             return True
             
         except Exception as e:
-            print(f"    Errore nella validazione struttura visiva: {e}")
+            logger.error("Errore nella validazione struttura visiva: %s", e)
             return False
 
-    def _accumulate_data(self, new_data: pd.DataFrame, filename: str):
-        """Accumula i nuovi dati nel dataset completo"""
-        if self.complete_data.empty:
-            self.complete_data = new_data
-        else:
-            self.complete_data = pd.concat([self.complete_data, new_data], ignore_index=True)
+    def prepare_output(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Ordina per data e filtra i dati da settembre 2019 in poi"""
+        return DataProcessor.sort_and_filter_by_date(
+            data, 
+            date_column='data_riferimento',
+            start_date='2019-09-01'
+        )
 
     def save_to_csv(self, filename: str):
         """Salva i dati accumulati in CSV ordinato per data"""
         if not self.complete_data.empty:
-            # Ordina e filtra i dati da settembre 2019 in poi 
-            sorted_data = DataProcessor.sort_and_filter_by_date(
-                self.complete_data, 
-                date_column='data_riferimento',
-                start_year=2019
-            )
+            sorted_data = self.prepare_output(self.complete_data)
             
-            # Filtra ulteriormente per includere solo da settembre 2019
-            sorted_data = sorted_data[sorted_data['data_riferimento'] >= '2019-09-01']
-            
-            csv_path = self.output_folder / filename
-            sorted_data.to_csv(csv_path, index=False)
+            csv_path = self._write_output(sorted_data, filename)
             
             print(f"\nDati sbarchi giornalieri salvati in: {csv_path}")
             print(f"Righe totali: {len(sorted_data)}")
@@ -316,18 +301,18 @@ class LandingsExtractor(BaseExtractor):
             print(f"File con successo: {len(self.processed_files) - len(self.failed_files)}")
             print(f"File falliti: {len(self.failed_files)}")
             
-            # Statistiche per anno
+            # Anno e mese dalle date ISO, senza aggiungere colonne al DataFrame già salvato
             if 'data_riferimento' in sorted_data.columns:
-                sorted_data['anno'] = sorted_data['data_riferimento'].str[:4]
-                stats = sorted_data['anno'].value_counts().sort_index()
+                date_rif = sorted_data['data_riferimento']
+                
+                # Statistiche per anno
+                stats = date_rif.str[:4].value_counts(sort=False).sort_index()
                 print("\nRighe per anno:")
                 for anno, count in stats.items():
                     print(f"  {anno}: {count} righe")
-            
-            # Statistiche per mese
-            if 'data_riferimento' in sorted_data.columns:
-                sorted_data['mese'] = sorted_data['data_riferimento'].str[5:7]
-                mese_stats = sorted_data['mese'].value_counts().sort_index()
+                
+                # Statistiche per mese
+                mese_stats = date_rif.str[5:7].value_counts(sort=False).sort_index()
                 print("\nRighe per mese:")
                 for mese, count in mese_stats.items():
                     print(f"  {mese}: {count} righe")
@@ -5,10 +5,32 @@ from pathlib import Path
 from typing import Optional, List
 import re
 import traceback
+import logging
 
 from extractors.base_extractor import BaseExtractor
 from utils.file_utils import DateExtractor, DataProcessor
 
+# Messaggi per singolo PDF via logging: con più processi di estrazione le righe non si mescolano
+logger = logging.getLogger(__name__)
+
+# Indicatori del titolo della tabella, già in maiuscolo
+# ("NAZIONALITÀ DICHIARATE" copre anche "... al momento dello sbarco")
+_TITLE_INDICATORS = (
+    'NAZIONALITÀ DICHIARATE',
+    'NAZIONALITÀ DICHIARATA AL MOMENTO DELLO SBARCO',
+)
+_TITLE_RE = re.compile(r'NAZIONALIT[ÀA].*DICHIARAT[AE].*SBARCO')
+# Prefiltro PyMuPDF: comune a indicatori e regex, senza la lettera accentata
+_TITLE_NEEDLE = 'NAZIONALIT'
+
+# Varianti di "Costa d'Avorio": apostrofi diversi (anche tipografici), doppio
+# apostrofo, codifica errata "â€™", capitalizzazione incoerente e spazi extra
+_COSTA_RE = re.compile(r"costa\s*d(?:['´`‘’]|''|â€™)\s*avorio", re.IGNORECASE)
+
+_WS_RE = re.compile(r'\s+')
+_NON_DIGIT_RE = re.compile(r'[^\d]')
+_EXCLUDED_RE = re.compile(r'TOTALE|NAZIONALITÀ|NAZIONALITA|NOTE|^\s*$', re.IGNORECASE)
+
 
 class NationalityExtractor(BaseExtractor):
     """Estrattore per i dati delle nazionalità dei migranti sbarcati"""
@@ -19,112 +41,98 @@ class NationalityExtractor(BaseExtractor):
     def extract_from_single_pdf(self, pdf_path: Path) -> Optional[pd.DataFrame]:
         """Estrae i dati delle nazionalità da un singolo PDF"""
         try:
-            print(f"Elaborando: {pdf_path.name}")
+            logger.debug("Elaborando: %s", pdf_path.name)
+            
+            # Lettura rapida con PyMuPDF (se installato): pdfplumber solo sulle pagine candidate
+            candidates = self._pages_containing(pdf_path, (_TITLE_NEEDLE,))
             
-            # Trova la pagina con la tabella delle nazionalità
-            page_num = self._find_table_page(pdf_path)
-            if page_num is None:
-                print(f"  Tabella nazionalità non trovata in {pdf_path.name}")
-                return None
+            with pdfplumber.open(pdf_path) as pdf:
+                # Trova la pagina con la tabella delle nazionalità
+                page_num = self._find_table_page(pdf, candidates)
+                if page_num is None and candidates is not None:
+                    # Filtro PyMuPDF senza esito: scansione completa con pdfplumber
+                    page_num = self._find_table_page(pdf)
+                if page_num is None:
+                    logger.info("Tabella nazionalità non trovata in %s", pdf_path.name)
+                    return None
 
-            print(f"  Trovata tabella nazionalità a pagina {page_num}")
+                logger.debug("Trovata tabella nazionalità a pagina %d", page_num)
 
-            # Estrae i dati dalla pagina
-            with pdfplumber.open(pdf_path) as pdf:
+                # Estrae i dati dalla stessa pagina già letta
                 page = pdf.pages[page_num]
                 table_data = self._extract_table_data(page)
                 
                 if table_data is not None and not table_data.empty:
                     processed_data = self._process_table_data(table_data, pdf_path.name)
-                    print(f"  Estrazione riuscita: {len(processed_data)} nazionalità")
+                    logger.debug("Estrazione riuscita: %d nazionalità", len(processed_data))
                     return processed_data
                 else:
-                    print(f"  Nessun dato estratto da {pdf_path.name}")
+                    logger.info("Nessun dato estratto da %s", pdf_path.name)
                     return None
                     
         except Exception as e:
-            print(f"Errore nell'elaborazione di {pdf_path.name}: {e}")
+            logger.error("Errore nell'elaborazione di %s: %s", pdf_path.name, e)
             return None
 
-    def _find_table_page(self, pdf_path: Path) -> Optional[int]:
-        """Trova la pagina con la tabella delle nazionalità"""
-        title_indicators = [
-            'Nazionalità dichiarate al momento dello sbarco',
-            'Nazionalità dichiarata al momento dello sbarco',
-            'Nazionalità dichiarate'
-        ]
-
+    def _find_table_page(self, pdf, candidates: Optional[set] = None) -> Optional[int]:
+        """Trova la pagina con la tabella delle nazionalità nel PDF già aperto"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page_num in range(len(pdf.pages)):
-                    page = pdf.pages[page_num]
-                    text = page.extract_text()
-                    
-                    if text:
-                        text_upper = text.upper()
-                        # Cerca con gli indicatori del titolo
-                        if any(indicator.upper() in text_upper for indicator in title_indicators):
-                            return page_num
-                        # Cerca con regex
-                        if re.search(r'NAZIONALIT[ÀA].*DICHIARAT[AE].*SBARCO', text_upper, re.IGNORECASE):
-                            return page_num
+            for page_num, page in enumerate(pdf.pages):
+                if candidates is not None and page_num not in candidates:
+                    continue
+                
+                text = page.extract_text()
+                
+                if text:
+                    text_upper = text.upper()
+                    # Cerca con gli indicatori del titolo
+                    if any(indicator in text_upper for indicator in _TITLE_INDICATORS):
+                        return page_num
+                    # Cerca con regex solo se gli indicatori non bastano
+                    if _TITLE_RE.search(text_upper):
+                        return page_num
             return None
         except Exception as e:
-            print(f"Errore nella ricerca della pagina: {e}")
+            logger.error("Errore nella ricerca della pagina: %s", e)
             return None
 
     def _extract_table_data(self, page) -> Optional[pd.DataFrame]:
         """Estrae i dati della tabella dalla pagina"""
         try:
-            # Estrae le tabelle con impostazioni di base
-            tables = page.extract_tables({
-                "vertical_strategy": "lines", 
-                "horizontal_strategy": "lines"
-            })
-            
-            if not tables:
-                return None
+            # Prima l'area sotto il titolo (meno linee e caratteri da analizzare), poi la pagina intera
+            title_area = self._crop_below_title(page)
+            regions = [page] if title_area is None else [title_area, page]
             
-            # Processa ogni tabella trovata
-            for table in tables:
-                if table and len(table) >= 3:  # Almeno 3 righe
-                    df = self._process_table_structure(table)
-                    if not df.empty:
-                        return df
+            for region in regions:
+                # Estrae le tabelle con impostazioni di base
+                tables = region.extract_tables({
+                    "vertical_strategy": "lines", 
+                    "horizontal_strategy": "lines"
+                })
+                
+                # Processa ogni tabella trovata
+                for table in tables:
+                    if table and len(table) >= 3:  # Almeno 3 righe
+                        df = self._process_table_structure(table)
+                        if not df.empty:
+                            return df
             
             return None
             
         except Exception as e:
-            print(f"Errore nell'estrazione della tabella: {e}")
+            logger.error("Errore nell'estrazione della tabella: %s", e)
             return None
 
-    def _normalize_nationality(self, nationality: str) -> str:
-        """Normalizza i nomi delle nazionalità con particolare attenzione a Costa d'Avorio"""
-        if not nationality:
-            return nationality
-            
-        # Converte in stringa e pulisce spazi
-        nationality = str(nationality).strip()
-        
-        # Normalizza "Costa d'Avorio" e tutte le varianti
-        # Gestisce diversi apostrofi, capitalizzazione inconsistente, spazi extra
-        costa_patterns = [
-            r"costa\s*d[''´`'']\s*avorio",  # "Costa d'avorio"
-            r"costa\s*d[''´`'']\s*Avorio",  # "Costa d'Avorio" 
-            r"costa\s*D[''´`'']\s*avorio",  # "Costa D'avorio"
-            r"costa\s*D[''´`'']\s*Avorio",  # "Costa D'Avorio"
-            r"costa\s*dâ€™\s*avorio",       # "Costa dâ€™avorio" (codifica errata)
-            r"costa\s*dâ€™\s*Avorio",       # "Costa dâ€™Avorio" (codifica errata)
-            r"costa\s*d''\s*avorio",        # "Costa d''avorio" (doppio apostrofo)
-            r"costa\s*d''\s*Avorio",        # "Costa d''Avorio" (doppio apostrofo)
-        ]
-        
-        for pattern in costa_patterns:
-            if re.search(pattern, nationality, re.IGNORECASE):
-                return "Costa d'Avorio"
-        
-        # Se non è una variante di Costa d'Avorio, mantieni il valore originale
-        return nationality
+    def _crop_below_title(self, page):
+        """Ritaglia la pagina dal titolo della tabella in giù; None se il titolo non si trova"""
+        title_word = next(
+            (word for word in page.extract_words() if word['text'].upper().startswith(_TITLE_NEEDLE)),
+            None
+        )
+        if title_word is None:
+            return None
+        x0, top, x1, bottom = page.bbox
+        return page.within_bbox((x0, max(top, title_word['top']), x1, bottom))
 
     def _process_table_structure(self, table_data: List[List[str]]) -> pd.DataFrame:
         """Processa la struttura della tabella per estrarre i dati delle nazionalità"""
@@ -141,7 +149,7 @@ class NationalityExtractor(BaseExtractor):
                         clean_cell = ""
                     else:
                         # Rimuove spazi multipli e newline
-                        clean_cell = re.sub(r'\s+', ' ', str(cell).strip())
+                        clean_cell = _WS_RE.sub(' ', str(cell).strip())
                     clean_row.append(clean_cell)
                 
                 # Aggiungi solo righe non vuote
@@ -170,46 +178,35 @@ class NationalityExtractor(BaseExtractor):
                 if not nazionalita.strip():
                     continue
                 
-                # Verifica che la seconda colonna contenga un numero
-                if not any(char.isdigit() for char in str(migranti_sbarcati)):
+                # Verifica che la seconda colonna contenga un numero e lo converte
+                cifre = _NON_DIGIT_RE.sub('', migranti_sbarcati)
+                if not cifre:
                     continue
                 
                 # Aggiunge ai dati validi
-                nationality_rows.append([nazionalita, migranti_sbarcati])
+                nationality_rows.append((nazionalita, int(cifre)))
             
             if not nationality_rows:
                 return pd.DataFrame()
             
-            # Crea DataFrame
-            df = pd.DataFrame(nationality_rows, columns=['nazionalita', 'migranti_sbarcati'])
-            
-            # Pulisce e converte i numeri
-            df['migranti_sbarcati'] = (
-                df['migranti_sbarcati']
-                .astype(str)
-                .str.replace(r'[^\d]', '', regex=True)
-            )
-            df['migranti_sbarcati'] = pd.to_numeric(df['migranti_sbarcati'], errors='coerce')
-            df = df.dropna(subset=['migranti_sbarcati'])
-            df['migranti_sbarcati'] = df['migranti_sbarcati'].fillna(0).astype(int)
+            # Crea DataFrame con i numeri già convertiti
+            df = pd.DataFrame.from_records(nationality_rows, columns=['nazionalita', 'migranti_sbarcati'])
             
             # Filtra righe non valide - MODIFICATO: include "altre"
             df = df[df['nazionalita'].notna() & (df['nazionalita'] != '')]
-            df = df[~df['nazionalita'].str.contains(
-                r'TOTALE|Totale|NAZIONALITÀ|NAZIONALITA|Note|NOTE|^\s*$', 
-                na=False, case=False
-            )]
+            df = df[~df['nazionalita'].str.contains(_EXCLUDED_RE, na=False)]
             
             # Filtra paesi con almeno 1 persona
             df = df[df['migranti_sbarcati'] > 0]
             
-            # Normalizza i nomi delle nazionalità
-            df['nazionalita'] = df['nazionalita'].apply(self._normalize_nationality)
+            # Normalizza "Costa d'Avorio" e tutte le varianti
+            is_costa = df['nazionalita'].str.contains(_COSTA_RE, na=False)
+            df['nazionalita'] = df['nazionalita'].mask(is_costa, "Costa d'Avorio")
             
             return df
             
         except Exception as e:
-            print(f"Errore nel processing della struttura tabellare: {e}")
+            logger.error("Errore nel processing della struttura tabellare: %s", e)
             return pd.DataFrame()
 
     def _process_table_data(self, table_data: pd.DataFrame, filename: str) -> pd.DataFrame:
@@ -224,33 +221,30 @@ class NationalityExtractor(BaseExtractor):
 
         return table_data
 
-    def _accumulate_data(self, new_data: pd.DataFrame, filename: str):
-        """Accumula i nuovi dati nel dataset completo"""
-        if self.complete_data.empty:
-            self.complete_data = new_data
-        else:
-            self.complete_data = pd.concat([self.complete_data, new_data], ignore_index=True)
+    def prepare_output(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Ordina per data, filtra dal 2017 in poi e rende categoriche le nazionalità"""
+        sorted_data = DataProcessor.sort_and_filter_by_date(
+            data, 
+            date_column='data_riferimento',
+            start_year=2017
+        )
+        
+        # Poche decine di nazionalità ripetute per ogni mese: nel Parquet restano categoriche
+        return sorted_data.assign(nazionalita=sorted_data['nazionalita'].astype('category'))
 
     def save_to_csv(self, filename: str):
         """Salva i dati accumulati in CSV ordinato per data"""
         if not self.complete_data.empty:
-            # Ordina e filtra i dati
-            sorted_data = DataProcessor.sort_and_filter_by_date(
-                self.complete_data, 
-                date_column='data_riferimento',
-                start_year=2017
-            )
+            sorted_data = self.prepare_output(self.complete_data)
             
-            csv_path = self.output_folder / filename
-            sorted_data.to_csv(csv_path, index=False)
+            csv_path = self._write_output(sorted_data, filename)
             
             print(f"\nDati nazionalità salvati in: {csv_path}")
             print(f"Righe totali: {len(sorted_data)}")
             
             # Statistiche per anno
             if 'data_riferimento' in sorted_data.columns:
-                sorted_data['anno'] = sorted_data['data_riferimento'].str[:4]
-                stats = sorted_data['anno'].value_counts().sort_index()
+                stats = sorted_data['data_riferimento'].str[:4].value_counts(sort=False).sort_index()
                 print("\nRighe per anno:")
                 for anno, count in stats.items():
                     print(f"  {anno}: {count} righe")
@@ -1,29 +1,21 @@
 # main.py
 import sys
-import subprocess
+import importlib.util
 import os
+import logging
 from pathlib import Path
 
 # Aggiunge il percorso del progetto a sys.path
 project_path = '/content/drive/MyDrive/MDA_2025_progetto_tesi'
 sys.path.insert(0, project_path)
 
-# Installa le dipendenze necessarie
-def install_dependencies():
-    try:
-        import pdfplumber
-    except ImportError:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "pdfplumber"])
-        print("pdfplumber installato")
-    
-    try:
-        import pyarrow
-    except ImportError:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "pyarrow"])
-        print("pyarrow installato")
+# Verifica le dipendenze necessarie (installate una volta con requirements.txt)
+def check_dependencies():
+    missing = [name for name in ("pdfplumber", "pyarrow") if importlib.util.find_spec(name) is None]
+    if missing:
+        sys.exit(f"Dipendenze mancanti: {', '.join(missing)} - eseguire: pip install -r requirements.txt")
 
-# Installa le dipendenze all'avvio
-install_dependencies()
+check_dependencies()
 
 from downloader.pdf_downloader import PDFDownloader
 from extractors.nationality_extractor import NationalityExtractor
@@ -38,6 +30,9 @@ def check_pdfs_exist():
     return len(pdf_files) > 0
 
 def main():
+    # Messaggi degli estrattori: INFO e superiori; DEBUG per il dettaglio di ogni PDF
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     print("Avvio estrazione dati")
     
     # FASE 1: Download PDF (se non presenti)
@@ -67,7 +62,7 @@ def main():
     print("="*50)
     
     extractor_naz = NationalityExtractor(config.PDF_SAVE_PATH, config.OUTPUT_PATH)
-    extractor_naz.process_all_pdfs() 
+    extractor_naz.process_all_pdfs(max_workers=config.EXTRACTION_WORKERS)
     extractor_naz.save_to_csv("dati_nazionalita.csv")
     
     # FASE 3: Estrazione dati accoglienza
@@ -76,7 +71,7 @@ def main():
     print("="*50)
     
     extractor_acc = AccommodationExtractor(config.PDF_SAVE_PATH, config.OUTPUT_PATH)
-    extractor_acc.process_all_pdfs()
+    extractor_acc.process_all_pdfs(max_workers=config.EXTRACTION_WORKERS)
     extractor_acc.save_to_csv("dati_accoglienza.csv")
     
     # FASE 4: Estrazione dati migranti sbarcati per giorno
@@ -85,7 +80,7 @@ def main():
     print("="*50)
     
     extractor_land = LandingsExtractor(config.PDF_SAVE_PATH, config.OUTPUT_PATH)
-    extractor_land.process_all_pdfs()
+    extractor_land.process_all_pdfs(max_workers=config.EXTRACTION_WORKERS)
     extractor_land.save_to_csv("dati_sbarchi.csv")
     
     # FASE 5: Conversione in formato Parquet
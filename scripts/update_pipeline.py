@@ -19,7 +19,7 @@ try:
     from extractors.nationality_extractor import NationalityExtractor
     from extractors.accommodation_extractor import AccommodationExtractor
     from extractors.landings_extractor import LandingsExtractor
-    from utils.file_utils import ParquetManager
+    from utils.file_utils import ParquetManager, DateExtractor
     from config.settings import config
 except ImportError as e:
     print(f"Errore negli import: {e}")
@@ -112,20 +112,15 @@ class MonthlyUpdatePipeline:
     
     def _get_recent_pdfs(self, pdf_files: list, months: int = 3) -> list:
         """Filtra solo i PDF più recenti"""
-        cutoff_date = datetime.now() - timedelta(days=months*30)
+        # Date "AAAA-MM-GG": il confronto tra stringhe segue l'ordine cronologico
+        cutoff = (datetime.now() - timedelta(days=months*30)).strftime('%Y-%m-%d')
         recent_files = []
         
         for pdf_file in pdf_files:
-            try:
-                # Estrae la data dal nome del file
-                from utils.file_utils import DateExtractor
-                date_str = DateExtractor.extract_date_from_filename(pdf_file.name)
-                if date_str != "Data_non_riconosciuta":
-                    file_date = datetime.strptime(date_str, '%Y-%m-%d')
-                    if file_date >= cutoff_date:
-                        recent_files.append(pdf_file)
-            except:
-                continue
+            # Estrae la data dal nome del file
+            date_str = DateExtractor.extract_date_from_filename(pdf_file.name)
+            if date_str != "Data_non_riconosciuta" and date_str >= cutoff:
+                recent_files.append(pdf_file)
         
         return sorted(recent_files)
     
@@ -152,9 +147,10 @@ class MonthlyUpdatePipeline:
                 else:
                     combined_data = all_new_data
                 
-                # Salva il dataset aggiornato
-                combined_data.to_csv(config.OUTPUT_PATH / output_filename, index=False)
-                print(f"Aggiornato {output_filename}: {len(combined_data)} righe")
+                # Salva il dataset aggiornato nella stessa forma dei file scritti da main.py
+                # (ordinamento stabile per data, filtri e tipi dell'estrattore; CSV e Parquet)
+                saved_data = extractor.save_dataset(combined_data, output_filename)
+                print(f"Aggiornato {output_filename}: {len(saved_data)} righe")
             else:
                 print(f"Nessun nuovo dato per {output_filename}")
                 
@@ -165,7 +161,8 @@ class MonthlyUpdatePipeline:
         """Carica i dati esistenti dal CSV"""
         file_path = config.OUTPUT_PATH / filename
         if file_path.exists():
-            return pd.read_csv(file_path)
+            # La data resta testo come nei DataFrame estratti: il confronto in _merge_datasets è diretto
+            return pd.read_csv(file_path, dtype={'data_riferimento': str})
         return pd.DataFrame()
     
     def _merge_datasets(self, existing: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
@@ -1,10 +1,22 @@
 # file_utils.py
+import os
 import re
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 from pathlib import Path
 from typing import Optional, Dict, Any
 from datetime import datetime
 
+# Formati di data nei nomi dei PDF, nell'ordine in cui vengono provati
+_DATE_DASH_RE = re.compile(r'(\d{2})-(\d{2})-(\d{4})')  # "31-10-2025"
+_DATE_SPACED_RE = re.compile(r'(\d{1,2})\s+(\w+)\s+(\d{4})')  # "31 ottobre 2025"
+_DATE_DOT_RE = re.compile(r'(\d{2})\.(\d{2})\.(\d{4})')  # "31.10.2025"
+_DATE_COMPACT_RE = re.compile(r'(\d{2})(\d{2})(\d{4})')  # "report_01012017.pdf" (solo 2017-2018)
+_DATE_CRUSCOTTO_RE = re.compile(r'cruscotto_statistico_giornaliero_(\d{1,2})_(\w+)_(\d{4})')
+_DATE_UNDERSCORE_RE = re.compile(r'(\d{1,2})_(\w+)_(\d{4})')  # "31_marzo_2017"
+
 class DateExtractor:
     """Classe centralizzata per l'estrazione delle date dal nome del file"""
     
@@ -18,66 +30,35 @@ class DateExtractor:
     def extract_date_from_filename(filename: str) -> str:
         """Estrae la data dal nome del file PDF"""
         try:
-            # Pattern per formato "31-10-2025"
-            pattern1 = r'(\d{2})-(\d{2})-(\d{4})'
-            match1 = re.search(pattern1, filename)
-            if match1:
-                giorno, mese, anno = match1.groups()
+            mesi = DateExtractor.MESI_ITALIANI
+            
+            match = _DATE_DASH_RE.search(filename)
+            if match:
+                giorno, mese, anno = match.groups()
                 return f"{anno}-{mese}-{giorno}"
 
-            # Pattern per formato "31 ottobre 2025"
-            pattern2 = r'(\d{1,2})\s+(\w+)\s+(\d{4})'
-            match2 = re.search(pattern2, filename)
-            if match2:
-                giorno, mese_str, anno = match2.groups()
-                mesi = {
-                    'gennaio': '01', 'febbraio': '02', 'marzo': '03', 'aprile': '04',
-                    'maggio': '05', 'giugno': '06', 'luglio': '07', 'agosto': '08',
-                    'settembre': '09', 'ottobre': '10', 'novembre': '11', 'dicembre': '12'
-                }
-                mese_num = mesi.get(mese_str.lower(), '01')
-                return f"{anno}-{mese_num}-{giorno.zfill(2)}"
+            match = _DATE_SPACED_RE.search(filename)
+            if match:
+                giorno, mese_str, anno = match.groups()
+                return f"{anno}-{mesi.get(mese_str.lower(), '01')}-{giorno.zfill(2)}"
 
-            # Pattern per formato "31.10.2025"
-            pattern3 = r'(\d{2})\.(\d{2})\.(\d{4})'
-            match3 = re.search(pattern3, filename)
-            if match3:
-                giorno, mese, anno = match3.groups()
+            match = _DATE_DOT_RE.search(filename)
+            if match:
+                giorno, mese, anno = match.groups()
                 return f"{anno}-{mese}-{giorno}"
 
-            # Pattern per file 2017-2018 (es: "report_01012017.pdf")
-            pattern4 = r'(\d{2})(\d{2})(\d{4})'
-            match4 = re.search(pattern4, filename)
-            if match4:
-                giorno, mese, anno = match4.groups()
+            match = _DATE_COMPACT_RE.search(filename)
+            if match:
+                giorno, mese, anno = match.groups()
                 if int(anno) in [2017, 2018]:
                     return f"{anno}-{mese}-{giorno}"
 
-            # Pattern per formato "cruscotto_statistico_giornaliero_31_marzo_2017_2.pdf"
-            pattern5 = r'cruscotto_statistico_giornaliero_(\d{1,2})_(\w+)_(\d{4})'
-            match5 = re.search(pattern5, filename)
-            if match5:
-                giorno, mese_str, anno = match5.groups()
-                mesi = {
-                    'gennaio': '01', 'febbraio': '02', 'marzo': '03', 'aprile': '04',
-                    'maggio': '05', 'giugno': '06', 'luglio': '07', 'agosto': '08',
-                    'settembre': '09', 'ottobre': '10', 'novembre': '11', 'dicembre': '12'
-                }
-                mese_num = mesi.get(mese_str.lower(), '01')
-                return f"{anno}-{mese_num}-{giorno.zfill(2)}"
-
-            # Pattern per formato "31_marzo_2017" (più generico)
-            pattern6 = r'(\d{1,2})_(\w+)_(\d{4})'
-            match6 = re.search(pattern6, filename)
-            if match6:
-                giorno, mese_str, anno = match6.groups()
-                mesi = {
-                    'gennaio': '01', 'febbraio': '02', 'marzo': '03', 'aprile': '04',
-                    'maggio': '05', 'giugno': '06', 'luglio': '07', 'agosto': '08',
-                    'settembre': '09', 'ottobre': '10', 'novembre': '11', 'dicembre': '12'
-                }
-                mese_num = mesi.get(mese_str.lower(), '01')
-                return f"{anno}-{mese_num}-{giorno.zfill(2)}"
+            # "cruscotto_statistico_giornaliero_31_marzo_2017_2.pdf", poi il formato "31_marzo_2017" più generico
+            for pattern in (_DATE_CRUSCOTTO_RE, _DATE_UNDERSCORE_RE):
+                match = pattern.search(filename)
+                if match:
+                    giorno, mese_str, anno = match.groups()
+                    return f"{anno}-{mesi.get(mese_str.lower(), '01')}-{giorno.zfill(2)}"
 
         except Exception as e:
             print(f"Errore nell'estrazione data da {filename}: {e}")
@@ -89,29 +70,56 @@ class DataProcessor:
     
     @staticmethod
     def sort_and_filter_by_date(df: pd.DataFrame, date_column: str = 'data_riferimento', 
-                              start_year: int = 2017) -> pd.DataFrame:
-        """Ordina e filtra i dati dalla data specificata"""
+                              start_year: int = 2017, start_date: Optional[str] = None) -> pd.DataFrame:
+        """Ordina e filtra i dati dalla data specificata (start_date 'YYYY-MM-DD' ha precedenza su start_year)"""
         if df.empty:
             return df
         
-        df_clean = df.copy()
-        df_clean['_temp_datetime'] = pd.to_datetime(df_clean[date_column], errors='coerce')
-        df_clean = df_clean[df_clean['_temp_datetime'] >= f'{start_year}-01-01']
-        df_clean = df_clean.sort_values('_temp_datetime')
-        return df_clean.drop('_temp_datetime', axis=1)
+        # Il filtro usa le date già convertite: nessun confronto tra stringhe a valle
+        soglia = start_date if start_date is not None else f'{start_year}-01-01'
+        
+        # Formato fisso di DateExtractor: niente inferenza per elemento; le date non riconosciute diventano NaT
+        date = pd.to_datetime(df[date_column], format='%Y-%m-%d', errors='coerce')
+        mask = (date >= soglia).to_numpy()
+        
+        # Un solo sottoinsieme delle righe, riordinato per posizione: nessuna colonna temporanea da aggiungere e togliere
+        return df[mask].iloc[date[mask].argsort(kind='mergesort').to_numpy()]
+    
+    @staticmethod
+    def top_k_by(df: pd.DataFrame, key_col: str, val_col: str, k: int = 5) -> list:
+        """Restituisce i k valori di key_col con val_col più alto (selezione parziale, senza ordinamento completo)"""
+        if df.empty:
+            return []
+        return df.nlargest(k, val_col)[key_col].tolist()
 
 class ParquetManager:
     """Gestisce la conversione e il caricamento dei dati in formato Parquet"""
     
     @staticmethod
-    def csv_to_parquet(csv_path: Path, parquet_path: Path, compression: str = 'snappy') -> bool:
-        """Converte un file CSV in formato Parquet"""
+    def csv_to_parquet(csv_path: Path, parquet_path: Path, compression: str = 'zstd',
+                       compression_level: Optional[int] = 3) -> bool:
+        """Converte un file CSV in formato Parquet a blocchi, senza costruire un DataFrame (compression_level=None per i codec senza livelli, es. snappy)"""
+        tmp_path = parquet_path.with_name(parquet_path.name + '.tmp')
         try:
-            df = pd.read_csv(csv_path)
-            df.to_parquet(parquet_path, compression=compression, index=False)
+            # data_riferimento resta testo come nei file scritti dagli estrattori (pyarrow la leggerebbe come data);
+            # celle vuote nulle come con pd.read_csv
+            convert_options = pa_csv.ConvertOptions(
+                column_types={'data_riferimento': pa.string()},
+                strings_can_be_null=True
+            )
+            reader = pa_csv.open_csv(csv_path, convert_options=convert_options)
+            
+            # File temporaneo: un errore a metà non lascia un Parquet troncato al posto di quello valido
+            with pq.ParquetWriter(tmp_path, reader.schema, compression=compression,
+                                  compression_level=compression_level) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+            os.replace(tmp_path, parquet_path)
+            
             print(f"Convertito: {csv_path.name} -> {parquet_path.name}")
             return True
         except Exception as e:
+            tmp_path.unlink(missing_ok=True)
             print(f"Errore conversione {csv_path.name}: {e}")
             return False
     
@@ -134,6 +142,13 @@ class ParquetManager:
         
         for csv_file in csv_files:
             parquet_file = parquet_directory / f"{csv_file.stem}.parquet"
+            
+            # Gli estrattori scrivono già il Parquet insieme al CSV: rilegge solo i CSV più recenti
+            if parquet_file.exists() and parquet_file.stat().st_mtime_ns >= csv_file.stat().st_mtime_ns:
+                print(f"Già aggiornato: {parquet_file.name}")
+                results[csv_file.name] = True
+                continue
+            
             results[csv_file.name] = ParquetManager.csv_to_parquet(csv_file, parquet_file)
         
         return results
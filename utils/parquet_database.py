@@ -4,7 +4,13 @@ Gestore del database in formato Parquet per l'analisi dei dati estratti dai pdf.
 Fornisce un'interfaccia simile a un ORM per accedere e interrogare i dati.
 """
 
+import json
+import os
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Union
 from datetime import datetime
@@ -15,16 +21,35 @@ from config.settings import config
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Colonne di testo a bassa cardinalità caricate come categoriche (stesso tipo a prescindere dai dati)
+_CATEGORICAL_COLUMNS = {'nazionalita', 'regione', 'tipologia', 'formato'}
+
+# Tipo fisso per gli interi caricati: piccoli solo i campi di calendario (limitati per natura),
+# int32 per i conteggi, così il dtype non cambia al crescere dei valori
+_BOUNDED_INT_DTYPES = {'giorno': np.int8, 'mese': np.int8, 'anno': np.int16}
+_COUNTER_INT_DTYPE = np.int32
+
+# Righe per blocco nelle letture in streaming dei file Parquet
+_BATCH_SIZE = 65536
+
+# File accanto ai Parquet con le statistiche già calcolate, valide finché il file non cambia
+_STATS_FILENAME = '.stats.json'
+
 class ParquetDatabase:
     """
     Database analitico basato su file Parquet.
     Gestisce il caricamento, l'interrogazione e l'analisi dei dati.
     """
     
-    def __init__(self, data_directory: Path = config.OUTPUT_PATH):
+    def __init__(self, data_directory: Path = config.OUTPUT_PATH, max_cache_bytes: Optional[int] = None):
         self.data_directory = data_directory
-        self._data_cache: Dict[str, pd.DataFrame] = {}
+        # Tabelle in memoria dalla meno alla più usata di recente; None = nessun limite di memoria
+        self.max_cache_bytes = max_cache_bytes
+        self._data_cache: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._cache_bytes: Dict[str, int] = {}
         self._metadata: Dict[str, Dict] = {}
+        self._stats_path = data_directory / _STATS_FILENAME
+        self._stats: Dict[str, Dict] = {}
         
         # Inizializzazione automatica
         self._initialize_database()
@@ -38,28 +63,41 @@ class ParquetDatabase:
             logger.warning(f"Directory dati non trovata: {self.data_directory}")
             return
         
-        # Carica i metadati delle tabelle
+        # Carica i metadati delle tabelle e le statistiche salvate
         self._load_table_metadata()
+        self._stats = self._load_stats()
     
     def _load_table_metadata(self):
-        """Carica i metadati di tutte le tabelle Parquet disponibili"""
-        parquet_files = list(self.data_directory.glob("*.parquet"))
+        """Registra le tabelle Parquet disponibili; schema e dimensioni vengono letti al primo accesso"""
+        for parquet_file in self.data_directory.glob("*.parquet"):
+            self._metadata[parquet_file.stem] = {'file_path': parquet_file}
+        logger.info(f"Tabelle trovate: {len(self._metadata)}")
+    
+    def _ensure_metadata(self, table_name: str) -> Optional[Dict]:
+        """Restituisce i metadati di una tabella, leggendo il footer del file solo la prima volta"""
+        meta = self._metadata.get(table_name)
+        if meta is None or 'columns' in meta:
+            return meta
         
-        for parquet_file in parquet_files:
-            table_name = parquet_file.stem
-            try:
-                # Legge solo i metadati senza caricare tutto il file
-                metadata = pd.read_parquet(parquet_file, engine='pyarrow').dtypes.to_dict()
-                self._metadata[table_name] = {
-                    'file_path': parquet_file,
-                    'columns': list(metadata.keys()),
-                    'dtypes': metadata,
-                    'size_mb': parquet_file.stat().st_size / (1024 * 1024),
-                    'last_modified': datetime.fromtimestamp(parquet_file.stat().st_mtime)
-                }
-                logger.info(f"Metadati caricati per: {table_name}")
-            except Exception as e:
-                logger.error(f"Errore caricamento metadati {table_name}: {e}")
+        try:
+            # Legge solo il footer del file: schema e numero di righe senza decodificare i dati
+            with pq.ParquetFile(meta['file_path']) as parquet_meta:
+                dtypes = parquet_meta.schema_arrow.empty_table().to_pandas().dtypes.to_dict()
+                num_rows = parquet_meta.metadata.num_rows
+            file_stat = meta['file_path'].stat()
+        except Exception as e:
+            logger.error(f"Errore caricamento metadati {table_name}: {e}")
+            return None
+        
+        meta.update({
+            'columns': list(dtypes.keys()),
+            'dtypes': dtypes,
+            'num_rows': num_rows,
+            'size_mb': file_stat.st_size / (1024 * 1024),
+            'last_modified': datetime.fromtimestamp(file_stat.st_mtime)
+        })
+        logger.info(f"Metadati caricati per: {table_name}")
+        return meta
     
     def load_all_tables(self) -> Dict[str, pd.DataFrame]:
         """Carica tutte le tabelle Parquet disponibili in memoria"""
@@ -68,19 +106,53 @@ class ParquetDatabase:
         for table_name, meta in self._metadata.items():
             if table_name not in self._data_cache:
                 try:
-                    self._data_cache[table_name] = pd.read_parquet(meta['file_path'])
-                    logger.info(f"Tabella caricata: {table_name} ({len(self._data_cache[table_name])} righe)")
+                    df = self._cache_table(table_name, self._read_table(meta['file_path']))
+                    logger.info(f"Tabella caricata: {table_name} ({len(df)} righe)")
                 except Exception as e:
                     logger.error(f"Errore caricamento {table_name}: {e}")
         
         return self._data_cache
     
+    def _cache_table(self, table_name: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Mette una tabella in cache e, oltre max_cache_bytes, scarta quelle usate meno di recente"""
+        self._data_cache[table_name] = df
+        self._data_cache.move_to_end(table_name)
+        if self.max_cache_bytes is not None:
+            # Dimensione calcolata una sola volta all'inserimento (memory_usage deep scorre le stringhe)
+            self._cache_bytes[table_name] = int(df.memory_usage(deep=True).sum())
+            while len(self._data_cache) > 1 and sum(self._cache_bytes.values()) > self.max_cache_bytes:
+                evicted, _ = self._data_cache.popitem(last=False)
+                del self._cache_bytes[evicted]
+                logger.info(f"Tabella rimossa dalla cache: {evicted}")
+        return df
+    
+    def _read_table(self, file_path: Path, columns: Optional[List[str]] = None,
+                    filters: Optional[List[tuple]] = None) -> pd.DataFrame:
+        """Legge un file Parquet (eventualmente solo alcune colonne e righe) convertendo una sola volta data_riferimento in datetime64"""
+        df = pd.read_parquet(file_path, columns=columns, filters=filters)
+        if 'data_riferimento' in df.columns:
+            df['data_riferimento'] = pd.to_datetime(df['data_riferimento'], format='%Y-%m-%d')
+        
+        # Testo a bassa cardinalità come category: group-by e filtri di uguaglianza lavorano sui codici interi
+        for column in _CATEGORICAL_COLUMNS.intersection(df.columns):
+            df[column] = df[column].astype('category')
+        
+        # Interi int64 nel tipo fisso della colonna; restano int64 se i valori non ci stanno
+        for column in df.select_dtypes(include=['int64']).columns:
+            target = _BOUNDED_INT_DTYPES.get(column, _COUNTER_INT_DTYPE)
+            limits = np.iinfo(target)
+            if df.empty or (df[column].min() >= limits.min and df[column].max() <= limits.max):
+                df[column] = df[column].astype(target)
+            else:
+                logger.warning(f"Colonna {column} fuori dall'intervallo di {limits.dtype}: resta int64")
+        return df
+    
     def get_table(self, table_name: str, force_reload: bool = False) -> pd.DataFrame:
         """Restituisce una tabella specifica, caricandola se necessario"""
         if force_reload or table_name not in self._data_cache:
             if table_name in self._metadata:
                 try:
-                    self._data_cache[table_name] = pd.read_parquet(self._metadata[table_name]['file_path'])
+                    return self._cache_table(table_name, self._read_table(self._metadata[table_name]['file_path']))
                 except Exception as e:
                     logger.error(f"Errore caricamento {table_name}: {e}")
                     return pd.DataFrame()
@@ -88,25 +160,78 @@ class ParquetDatabase:
                 logger.warning(f"Tabella {table_name} non trovata")
                 return pd.DataFrame()
         
+        self._data_cache.move_to_end(table_name)
         return self._data_cache[table_name]
     
+    def get_distinct_values(self, table_name: str, column: str) -> List:
+        """Restituisce i valori distinti ordinati di una colonna, leggendo dal file solo quella colonna"""
+        if table_name in self._data_cache:
+            df = self._data_cache[table_name]
+        elif table_name in self._metadata:
+            try:
+                df = pd.read_parquet(self._metadata[table_name]['file_path'], columns=[column])
+            except Exception as e:
+                logger.error(f"Errore lettura colonna {column} di {table_name}: {e}")
+                return []
+        else:
+            logger.warning(f"Tabella {table_name} non trovata")
+            return []
+        
+        if column not in df.columns:
+            return []
+        return sorted(df[column].dropna().unique())
+    
     def get_available_tables(self) -> List[str]:
         """Restituisce la lista delle tabelle disponibili"""
         return list(self._metadata.keys())
     
     def get_table_info(self, table_name: str) -> Optional[Dict]:
         """Restituisce informazioni dettagliate su una tabella"""
-        if table_name in self._metadata:
-            info = self._metadata[table_name].copy()
-            if table_name in self._data_cache:
-                df = self._data_cache[table_name]
-                info.update({
-                    'row_count': len(df),
-                    'date_range': self._get_date_range(df),
-                    'memory_usage_mb': df.memory_usage(deep=True).sum() / (1024 * 1024)
-                })
-            return info
-        return None
+        meta = self._ensure_metadata(table_name)
+        if meta is None:
+            return None
+        
+        info = meta.copy()
+        try:
+            file_stat = meta['file_path'].stat()
+            file_key = [file_stat.st_mtime_ns, file_stat.st_size]
+        except OSError:
+            file_key = None
+        
+        # Statistiche salvate ancora valide se il file ha stessa data di modifica e dimensione
+        saved = self._stats.get(table_name)
+        if file_key is not None and saved is not None and saved.get('file_key') == file_key:
+            info.update(saved['stats'])
+        elif table_name in self._data_cache:
+            df = self._data_cache[table_name]
+            table_stats = {
+                'row_count': len(df),
+                'date_range': self._get_date_range(df),
+                'memory_usage_mb': float(df.memory_usage(deep=True).sum()) / (1024 * 1024)
+            }
+            info.update(table_stats)
+            if file_key is not None:
+                self._stats[table_name] = {'file_key': file_key, 'stats': table_stats}
+                self._save_stats()
+        return info
+    
+    def _load_stats(self) -> Dict[str, Dict]:
+        """Legge le statistiche salvate in precedenza accanto ai file Parquet"""
+        try:
+            with open(self._stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def _save_stats(self):
+        """Salva le statistiche su disco (scrittura atomica: file temporaneo + os.replace)"""
+        tmp_path = self._stats_path.with_suffix('.json.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._stats, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._stats_path)
+        except OSError as e:
+            logger.warning(f"Impossibile salvare le statistiche in {self._stats_path}: {e}")
     
     def _get_date_range(self, df: pd.DataFrame) -> Dict[str, str]:
         """Estrae l'intervallo di date dai dati"""
@@ -138,80 +263,179 @@ class ParquetDatabase:
         Returns:
             DataFrame filtrato
         """
-        df = self.get_table(table_name)
+        if columns and table_name not in self._data_cache and self._ensure_metadata(table_name):
+            # Tabella non ancora in memoria: dal file solo le colonne richieste e quelle dei filtri (non va in cache)
+            needed = set(columns) | {date_column} | set(filters or ())
+            read_columns = [col for col in self._metadata[table_name]['columns'] if col in needed]
+            try:
+                row_filters = self._date_pushdown_filters(table_name, date_column, start_date, end_date)
+                df = self._read_table(self._metadata[table_name]['file_path'], columns=read_columns,
+                                      filters=row_filters or None)
+            except Exception as e:
+                logger.error(f"Errore caricamento {table_name}: {e}")
+                return pd.DataFrame()
+        else:
+            df = self.get_table(table_name)
         
         if df.empty:
             return df
         
-        result = df.copy()
+        # Un'unica maschera per tutti i filtri: la tabella viene copiata una sola volta, alla selezione finale
+        mask = np.ones(len(df), dtype=bool)
+        converted_dates = None
         
-        # Filtro temporale
+        # Filtro temporale (data_riferimento è già datetime64 dal caricamento)
         if date_column in df.columns:
-            result[date_column] = pd.to_datetime(result[date_column])
+            date_values = df[date_column]
+            if not pd.api.types.is_datetime64_any_dtype(date_values):
+                converted_dates = date_values = pd.to_datetime(date_values)
             
             if start_date:
-                start_date = pd.to_datetime(start_date)
-                result = result[result[date_column] >= start_date]
+                mask &= (date_values >= pd.to_datetime(start_date)).to_numpy(dtype=bool, na_value=False)
             
             if end_date:
-                end_date = pd.to_datetime(end_date)
-                result = result[result[date_column] <= end_date]
+                mask &= (date_values <= pd.to_datetime(end_date)).to_numpy(dtype=bool, na_value=False)
         
         # Filtri aggiuntivi
         if filters:
             for column, value in filters.items():
-                if column in result.columns:
+                if column in df.columns:
                     if isinstance(value, (list, tuple)):
-                        result = result[result[column].isin(value)]
+                        condition = df[column].isin(value)
                     else:
-                        result = result[result[column] == value]
+                        condition = df[column] == value
+                    mask &= condition.to_numpy(dtype=bool, na_value=False)
         
-        # Selezione colonne
+        # Selezione righe e colonne in un solo passaggio
         if columns:
-            available_columns = [col for col in columns if col in result.columns]
-            result = result[available_columns]
+            available_columns = [col for col in columns if col in df.columns]
+            result = df.loc[mask, available_columns]
+        else:
+            result = df.loc[mask]
+        
+        # Colonna data convertita al volo: nel risultato come datetime64
+        if converted_dates is not None and date_column in result.columns:
+            result = result.assign(**{date_column: converted_dates[mask].to_numpy()})
         
         return result.reset_index(drop=True)
     
+    def _date_pushdown_filters(self, table_name: str, date_column: str,
+                               start_date: Optional[Union[str, datetime]],
+                               end_date: Optional[Union[str, datetime]]) -> List[tuple]:
+        """
+        Filtri sulle date da passare alla lettura del Parquet: pyarrow salta i row group fuori intervallo
+        usando le statistiche min/max. Includono sempre tutte le righe valide; il filtro esatto resta in query_data.
+        """
+        dtype = self._metadata[table_name]['dtypes'].get(date_column)
+        if dtype is None:
+            return []
+        
+        # Nel file la data può essere testo 'AAAA-MM-GG' (confronto tra stringhe) oppure già timestamp
+        is_datetime = pd.api.types.is_datetime64_any_dtype(dtype)
+        row_filters = []
+        if start_date:
+            start = pd.to_datetime(start_date)
+            row_filters.append((date_column, '>=', start if is_datetime else start.strftime('%Y-%m-%d')))
+        if end_date:
+            end = pd.to_datetime(end_date)
+            row_filters.append((date_column, '<=', end if is_datetime else end.strftime('%Y-%m-%d')))
+        return row_filters
+    
     def get_temporal_coverage(self, table_name: str) -> pd.DataFrame:
         """Restituisce la copertura temporale dei dati per anno/mese"""
-        df = self.get_table(table_name)
+        if table_name in self._data_cache:
+            df = self.get_table(table_name)
+            if df.empty or 'data_riferimento' not in df.columns:
+                return pd.DataFrame()
+            dtypes = df.dtypes
+            main_numeric_column = self._main_numeric_column(dtypes)
+            month_index, values = self._month_values(
+                df['data_riferimento'], df[main_numeric_column] if main_numeric_column else None
+            )
+            if len(month_index) == 0:
+                return pd.DataFrame()
+            months, counts, totals = self._sum_by_month(month_index, None, values)
+        else:
+            meta = self._ensure_metadata(table_name)
+            if meta is None or 'data_riferimento' not in meta['columns']:
+                return pd.DataFrame()
+            dtypes = pd.Series(meta['dtypes'])
+            main_numeric_column = self._main_numeric_column(dtypes)
+            
+            # Tabella non in memoria: lettura a blocchi di righe, in memoria solo un blocco e i parziali per mese
+            read_columns = ['data_riferimento'] + ([main_numeric_column] if main_numeric_column else [])
+            parts = []
+            try:
+                with pq.ParquetFile(meta['file_path']) as parquet_file:
+                    for batch in parquet_file.iter_batches(batch_size=_BATCH_SIZE, columns=read_columns):
+                        month_index, values = self._month_values(
+                            batch.column('data_riferimento').to_pandas(),
+                            batch.column(main_numeric_column).to_pandas() if main_numeric_column else None
+                        )
+                        if len(month_index):
+                            parts.append(self._sum_by_month(month_index, None, values))
+            except Exception as e:
+                logger.error(f"Errore lettura {table_name}: {e}")
+                return pd.DataFrame()
+            if not parts:
+                return pd.DataFrame()
+            months, counts, totals = self._sum_by_month(
+                np.concatenate([part[0] for part in parts]),
+                np.concatenate([part[1] for part in parts]),
+                np.concatenate([part[2] for part in parts]) if main_numeric_column else None
+            )
         
-        if df.empty or 'data_riferimento' not in df.columns:
-            return pd.DataFrame()
+        coverage = pd.DataFrame({
+            'anno': months // 12 + 1970,
+            'mese': months % 12 + 1,
+            'record_per_mese': counts
+        })
         
-        df['data_riferimento'] = pd.to_datetime(df['data_riferimento'])
-        df['anno'] = df['data_riferimento'].dt.year
-        df['mese'] = df['data_riferimento'].dt.month
+        if main_numeric_column:
+            if pd.api.types.is_integer_dtype(dtypes[main_numeric_column]):
+                totals = totals.astype(np.int64)
+            coverage['totale'] = totals
         
-        # Identifica la colonna numerica principale per la somma
-        numeric_columns = df.select_dtypes(include=['number']).columns
-        main_numeric_column = None
+        return coverage
+    
+    @staticmethod
+    def _main_numeric_column(dtypes: pd.Series) -> Optional[str]:
+        """Sceglie la colonna numerica principale da sommare nella copertura temporale"""
+        numeric_columns = [col for col, dtype in dtypes.items()
+                           if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
         
         # Cerca colonne numeriche tipiche
         for col in ['migranti_sbarcati', 'totale_accoglienza', 'migranti_hot_spot', 
                     'migranti_centri_accoglienza', 'migranti_siproimi_sai']:
             if col in numeric_columns:
-                main_numeric_column = col
-                break
+                return col
         
         # Se non trova colonne specifiche, usa la prima colonna numerica
-        if main_numeric_column is None and len(numeric_columns) > 0:
-            main_numeric_column = numeric_columns[0]
-        
-        # Costruisce l'aggregazione
-        agg_dict = {'data_riferimento': 'count'}
-        if main_numeric_column:
-            agg_dict[main_numeric_column] = 'sum'
-        
-        coverage = df.groupby(['anno', 'mese']).agg(agg_dict).rename(
-            columns={'data_riferimento': 'record_per_mese'}
-        )
-        
-        if main_numeric_column:
-            coverage = coverage.rename(columns={main_numeric_column: 'totale'})
-        
-        return coverage.reset_index()
+        return numeric_columns[0] if numeric_columns else None
+    
+    @staticmethod
+    def _month_values(dates: pd.Series, values: Optional[pd.Series]):
+        """Indice del mese (mesi dal 1970) e valori da sommare, scartando le righe senza data"""
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, format='%Y-%m-%d')
+        months = dates.to_numpy(dtype='datetime64[M]')
+        valid = ~np.isnat(months)
+        if values is not None:
+            values = values.to_numpy(dtype=np.float64, na_value=0.0)[valid]
+        return months[valid].astype(np.int64), values
+    
+    @staticmethod
+    def _sum_by_month(month_index: np.ndarray, counts: Optional[np.ndarray], totals: Optional[np.ndarray]):
+        """
+        Conteggi e totali per mese con np.bincount sulla chiave lineare anno*12+mese, senza group-by.
+        counts None conta una riga per elemento; restituisce solo i mesi presenti.
+        """
+        first_month = month_index.min()
+        keys = month_index - first_month
+        month_counts = np.bincount(keys, weights=counts).astype(np.int64)
+        present = month_counts.nonzero()[0]
+        month_totals = np.bincount(keys, weights=totals)[present] if totals is not None else None
+        return present + first_month, month_counts[present], month_totals
     
     def explain_record_count(self, table_name: str) -> str:
         """Spiega cosa rappresenta record_per_mese per ogni tabella"""
@@ -249,22 +473,31 @@ class ParquetDatabase:
         
         return stats
 
-# Istanza globale del database per l'applicazione
-database = ParquetDatabase()
+# Istanza globale del database per l'applicazione, creata al primo utilizzo e non all'import
+@lru_cache(maxsize=1)
+def get_database() -> ParquetDatabase:
+    """Restituisce l'istanza condivisa del database"""
+    return ParquetDatabase()
+
+def __getattr__(name: str):
+    # Compatibilità con `from utils.parquet_database import database`
+    if name == 'database':
+        return get_database()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Funzioni di utilità per accesso rapido
 def get_table_names() -> List[str]:
     """Restituisce i nomi di tutte le tabelle disponibili"""
-    return database.get_available_tables()
+    return get_database().get_available_tables()
 
 def quick_query(table_name: str, **kwargs) -> pd.DataFrame:
     """Query rapida con sintassi semplificata"""
-    return database.query_data(table_name, **kwargs)
+    return get_database().query_data(table_name, **kwargs)
 
 def get_database_info() -> Dict:
     """Restituisce informazioni sul database"""
-    return database.get_database_stats()
+    return get_database().get_database_stats()
 
 def explain_record_count(table_name: str) -> str:
     """Spiega cosa rappresenta record_per_mese per una tabella"""
-    return database.explain_record_count(table_name)
+    return get_database().explain_record_count(table_name)